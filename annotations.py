@@ -0,0 +1,178 @@
+import bisect
+
+class Annotation(object):
+    # a labeled behavior between two times (s), along with the graphics items that show it. proposed
+    # behaviors were found by the bout detector and haven't been checked yet, and may have a label
+    # predicted with some confidence
+    def __init__(self, label, start_time, end_time, proposed=False):
+        self.label      = label
+        self.start_time = start_time
+        self.end_time   = end_time
+        self.proposed   = proposed
+        self.confidence = None
+        self.items      = []
+
+    def bounds(self):
+        # the start time can be after the end time while a boundary is being dragged
+        return min(self.start_time, self.end_time), max(self.start_time, self.end_time)
+
+class AnnotationStore(object):
+    # annotations of a recording, kept sorted by their lower bound so that finding the annotations
+    # at a time or in a range of times takes O(log n) plus the number of annotations that start
+    # within the longest duration before it. adding and removing annotations shifts the sorted
+    # lists, which is O(n), as is moving a boundary past the start of another annotation.
+    # the version counts changes, and on_change is called after each one. initial annotations are
+    # given as (label, start time, end time, proposed) and don't count as changes
+    def __init__(self, on_change=None, annotations=()):
+        self.annotations  = []
+        self.lower_bounds = []
+
+        # sorted durations of the annotations. an annotation containing a time has to start at
+        # most the longest of them before it
+        self.durations = []
+
+        self.item_annotations = {}
+
+        self.version   = 0
+        self.on_change = on_change
+
+        for label, start_time, end_time, proposed in annotations:
+            self.insert(Annotation(label, start_time, end_time, proposed=proposed))
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __iter__(self):
+        return iter(list(self.annotations))
+
+    def add(self, label, start_time, end_time, proposed=False):
+        annotation = Annotation(label, start_time, end_time, proposed=proposed)
+
+        self.insert(annotation)
+        self.changed()
+
+        return annotation
+
+    def delete(self, annotation):
+        self.delete_all([annotation])
+
+    def delete_all(self, annotations):
+        # delete any number of annotations in O(n)
+        deleted = set(annotations)
+
+        if len(deleted) == 0:
+            return
+
+        for annotation in deleted:
+            for item in annotation.items:
+                self.item_annotations.pop(item, None)
+
+        self.annotations  = [ annotation for annotation in self.annotations if annotation not in deleted ]
+        self.lower_bounds = [ annotation.bounds()[0] for annotation in self.annotations ]
+        self.durations    = sorted([ upper - lower for lower, upper in [ a.bounds() for a in self.annotations ] ])
+
+        self.changed()
+
+    def relabel(self, annotation, label):
+        if annotation.label != label:
+            annotation.label = label
+
+            self.changed()
+
+    def accept(self, annotation):
+        was_proposed = annotation.proposed
+
+        annotation.proposed   = False
+        annotation.confidence = None
+
+        if was_proposed:
+            self.changed()
+
+    def move(self, annotation, start_time=None, end_time=None):
+        i = self.index(annotation)
+
+        self.remove_duration(annotation)
+
+        if start_time is not None:
+            annotation.start_time = start_time
+        if end_time is not None:
+            annotation.end_time = end_time
+
+        lower, upper = annotation.bounds()
+
+        # annotations usually stay between their neighbours while a boundary is dragged, in which case
+        # they keep their place
+        if (i == 0 or self.lower_bounds[i-1] <= lower) and (i == len(self.annotations) - 1 or lower <= self.lower_bounds[i+1]):
+            self.lower_bounds[i] = lower
+        else:
+            del self.lower_bounds[i]
+            del self.annotations[i]
+
+            i = bisect.bisect_right(self.lower_bounds, lower)
+            self.lower_bounds.insert(i, lower)
+            self.annotations.insert(i, annotation)
+
+        bisect.insort(self.durations, upper - lower)
+
+        self.changed()
+
+    def changed(self):
+        self.version += 1
+
+        if self.on_change is not None:
+            self.on_change()
+
+    def set_items(self, annotation, items):
+        for item in annotation.items:
+            self.item_annotations.pop(item, None)
+
+        annotation.items = items
+
+        for item in items:
+            self.item_annotations[item] = annotation
+
+    def annotation_for_item(self, item):
+        return self.item_annotations.get(item)
+
+    def at(self, time):
+        # return the first annotation containing a time, or None
+        for annotation in self.candidates(time, time):
+            if annotation.bounds()[1] >= time:
+                return annotation
+
+        return None
+
+    def in_range(self, start_time, end_time):
+        # return the annotations that overlap a range of times
+        return [ annotation for annotation in self.candidates(start_time, end_time) if annotation.bounds()[1] >= start_time ]
+
+    def max_duration(self):
+        return self.durations[-1] if len(self.durations) > 0 else 0.0
+
+    def candidates(self, start_time, end_time):
+        start = bisect.bisect_left(self.lower_bounds, start_time - self.max_duration())
+        end   = bisect.bisect_right(self.lower_bounds, end_time)
+
+        return self.annotations[start:end]
+
+    def insert(self, annotation):
+        lower, upper = annotation.bounds()
+
+        i = bisect.bisect_right(self.lower_bounds, lower)
+        self.lower_bounds.insert(i, lower)
+        self.annotations.insert(i, annotation)
+
+        bisect.insort(self.durations, upper - lower)
+
+    def index(self, annotation):
+        # annotations with the same lower bound are next to each other
+        i = bisect.bisect_left(self.lower_bounds, annotation.bounds()[0])
+        while self.annotations[i] is not annotation:
+            i += 1
+
+        return i
+
+    def remove_duration(self, annotation):
+        lower, upper = annotation.bounds()
+
+        del self.durations[bisect.bisect_left(self.durations, upper - lower)]
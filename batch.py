@@ -0,0 +1,98 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import multiprocessing
+
+from tail_angles import framerate, load_tail_angles
+from signals import load_tip_angles
+from segmentation import default_parameters, segment_bouts
+from annotations import Annotation
+from features import annotation_frames, compute_bout_features
+from results import behaviors_path, features_path, save_behaviors, save_features
+
+# detect the bouts in every tail angle file of a folder and save them as behaviors, without a display.
+# only numpy and the standard library are imported, so that this can run on compute nodes
+
+def segment_tail_angles(job):
+    # detect and save the bouts of one tail angle file. returns (path, results path, frames, bytes, bouts, time, error)
+    tail_angle_path, output_directory, parameters, overwrite, save_bout_features, mark_proposed = job
+
+    start_time   = time.time()
+    results_path = behaviors_path(output_directory, tail_angle_path)
+
+    if os.path.exists(results_path) and not overwrite:
+        return tail_angle_path, results_path, 0, 0, 0, 0.0, "'{}' already exists.".format(results_path)
+
+    try:
+        tail_angles = load_tail_angles(tail_angle_path)
+        tip_angles  = load_tip_angles(tail_angle_path, lambda: tail_angles)
+
+        bout_framerate = parameters.pop('framerate', framerate)
+
+        bouts       = segment_bouts(tip_angles, bout_framerate, **parameters)
+        # detected bouts are proposals, like the ones the GUI detects, until they are reviewed
+        annotations = [ Annotation(label, bout_start_time, bout_end_time, proposed=True) for label, bout_start_time, bout_end_time in bouts ]
+
+        save_behaviors(results_path, annotations, mark_proposed=mark_proposed)
+
+        if save_bout_features:
+            starts, ends = annotation_frames(annotations, bout_framerate)
+            save_features(features_path(output_directory, tail_angle_path), annotations, compute_bout_features(tail_angles, tip_angles, starts, ends, bout_framerate), mark_proposed=mark_proposed)
+    except Exception as error:
+        return tail_angle_path, results_path, 0, 0, 0, time.time() - start_time, str(error)
+
+    return tail_angle_path, results_path, len(tip_angles), os.path.getsize(tail_angle_path), len(bouts), time.time() - start_time, None
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Detect the bouts in every *_tail_angles.csv file of a folder and save them as *_behaviors.csv files.")
+    parser.add_argument('directory', help="folder containing the tail angle files")
+    parser.add_argument('--output', help="folder where the behaviors are saved (default: the tail angle folder)")
+    parser.add_argument('--processes', type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--overwrite', action='store_true', help="replace existing behavior files")
+    parser.add_argument('--features', action='store_true', help="also save the features of the bouts as *_bout_features.csv files")
+    parser.add_argument('--mark-proposed', action='store_true', help="add a Proposed column marking the bouts as proposed behaviors")
+    parser.add_argument('--framerate', type=float, default=framerate, help="frame rate of the recordings (Hz)")
+    for name, value in sorted(default_parameters.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=float, default=value, help="bout detection parameter (default: {})".format(value))
+    args = parser.parse_args(args)
+
+    output_directory = args.output or args.directory
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    parameters = { name: getattr(args, name) for name in default_parameters }
+    parameters['framerate'] = args.framerate
+
+    tail_angle_paths = sorted(glob.glob(os.path.join(args.directory, '*_tail_angles.csv')))
+    jobs             = [ (tail_angle_path, output_directory, dict(parameters), args.overwrite, args.features, args.mark_proposed) for tail_angle_path in tail_angle_paths ]
+
+    start_time = time.time()
+    n_files    = 0
+    n_frames   = 0
+    n_bytes    = 0
+
+    pool = multiprocessing.Pool(args.processes)
+    for tail_angle_path, results_path, file_frames, file_bytes, n_bouts, file_time, error in pool.imap_unordered(segment_tail_angles, jobs):
+        if error is None:
+            print("Saved {} bouts of '{}' ({} frames) to '{}' in {:.2f} s.".format(n_bouts, tail_angle_path, file_frames, results_path, file_time))
+
+            n_files  += 1
+            n_frames += file_frames
+            n_bytes  += file_bytes
+        else:
+            print("Error processing '{}': {}".format(tail_angle_path, error))
+    pool.close()
+    pool.join()
+
+    total_time = max(time.time() - start_time, 1e-6)
+
+    print("Processed {} of {} files ({:.1f} MB, {} frames) in {:.2f} s ({:.1f} MB/s, {:.0f} frames/s).".format(n_files, len(tail_angle_paths), n_bytes/1e6, n_frames, total_time,
+                                                                                                         n_bytes/1e6/total_time, n_frames/total_time))
+
+    return 0 if n_files == len(tail_angle_paths) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
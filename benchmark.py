@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+# time the hot paths of the GUI on synthetic recordings and print the results as JSON, eg.
+# "python benchmark.py --recordings 4 --frames 100000 --output results.json". Qt runs on the offscreen
+# platform unless QT_QPA_PLATFORM is set, so this also works on machines without a display
+
+def generate_tail_angles(path, n_frames, n_segments, random_state):
+    # noise, with a bout every few seconds whose amplitude grows towards the tip of the tail
+    tail_angles = random_state.normal(0, 2, (n_frames, n_segments))
+
+    bout_length = 60
+    for start in range(random_state.randint(100, 700), n_frames - bout_length, 700):
+        phase     = 2*np.pi*np.arange(bout_length)/random_state.randint(15, 30)
+        amplitude = random_state.uniform(10, 80)*np.linspace(0.2, 1, n_segments)
+
+        tail_angles[start:start+bout_length] += np.sin(phase)[:, np.newaxis]*amplitude[np.newaxis, :]
+
+    # frames where the tail wasn't tracked
+    tail_angles[random_state.rand(n_frames) < 0.001] = np.nan
+
+    np.savetxt(path, np.column_stack((np.arange(n_frames), tail_angles)), fmt='%.6f', delimiter=',')
+
+def generate_video(path, n_frames, width, height):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 349, (width, height))
+
+    # a bar that moves across a gradient, so that neighbouring frames differ
+    background = np.tile(np.linspace(0, 200, width).astype(np.uint8), (height, 1))
+    for frame_num in range(n_frames):
+        frame = background.copy()
+        x     = frame_num % width
+        frame[:, x:x+8] = 255
+
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+
+    writer.release()
+
+def summarize(times):
+    # statistics of a list of durations (s), in ms
+    times = np.array(times)*1000
+
+    return {
+        'n':      len(times),
+        'mean':   float(np.mean(times)),
+        'median': float(np.median(times)),
+        'p95':    float(np.percentile(times, 95)),
+        'min':    float(np.min(times)),
+        'max':    float(np.max(times))
+    }
+
+def wait_until(app, condition, timeout=10.0):
+    # process events until a condition holds, returning whether it did
+    start_time = time.time()
+    while not condition():
+        if time.time() - start_time > timeout:
+            return False
+
+        app.processEvents()
+        time.sleep(0.0005)
+
+    return True
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Time the hot paths of the GUI on synthetic recordings.")
+    parser.add_argument('--recordings', type=int, default=4, help="number of recordings")
+    parser.add_argument('--frames', type=int, default=100000, help="frames per recording")
+    parser.add_argument('--segments', type=int, default=10, help="tail segments per recording")
+    parser.add_argument('--video-frames', type=int, default=5000, help="frames per video")
+    parser.add_argument('--video-size', type=int, nargs=2, default=[320, 240], metavar=('WIDTH', 'HEIGHT'), help="size of the videos")
+    parser.add_argument('--annotations', type=int, default=1000, help="behaviors added to the selected recording")
+    parser.add_argument('--repeat', type=int, default=50, help="repetitions of each timed operation")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument('--directory', help="folder for the synthetic data and caches (default: a temporary folder that is removed afterwards)")
+    parser.add_argument('--output', help="file to write the results to (default: print them)")
+    args = parser.parse_args(args)
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    if args.directory is None:
+        directory = tempfile.mkdtemp()
+    else:
+        directory = args.directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # keep caches and saved files inside the benchmark folder, so that every run starts cold
+    import tail_angles
+    tail_angles.cache_dir = os.path.join(directory, "cache")
+
+    import gui
+    gui.autosave_directory = os.path.join(directory, "autosave")
+
+    random_state = np.random.RandomState(args.seed)
+    results      = {}
+
+    # messages printed while running go to stderr, so that only the results are printed to stdout
+    stdout     = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        # generate recordings
+        start_time = time.time()
+
+        tail_angle_paths = []
+        video_paths      = []
+        for i in range(args.recordings):
+            tail_angle_path = os.path.join(directory, "fish{}_tail_angles.csv".format(i + 1))
+            video_path      = os.path.join(directory, "fish{}.avi".format(i + 1))
+
+            if not os.path.exists(tail_angle_path):
+                generate_tail_angles(tail_angle_path, args.frames, args.segments, random_state)
+            if not os.path.exists(video_path):
+                generate_video(video_path, args.video_frames, args.video_size[0], args.video_size[1])
+
+            tail_angle_paths.append(tail_angle_path)
+            video_paths.append(video_path)
+
+        results['generate'] = summarize([time.time() - start_time])
+
+        # parse a CSV without the cache
+        times = []
+        for tail_angle_path in tail_angle_paths:
+            start_time = time.time()
+            tail_angles.parse_tail_angles(tail_angle_path)
+            times.append(time.time() - start_time)
+
+        results['csv_parse'] = summarize(times)
+
+        app = gui.QApplication(sys.argv)
+
+        window = gui.Window()
+        window.resize(1200, 500)
+        app.processEvents()
+        window.create_deferred_widgets()
+
+        # import all recordings, cold and then from the cache
+        for name in ['import_cold', 'import_cached']:
+            start_time = time.time()
+
+            window.import_tail_angle_paths(tail_angle_paths)
+            wait_until(app, lambda: not window.import_timer.isActive(), timeout=600)
+
+            results[name] = summarize([time.time() - start_time])
+
+            if name == 'import_cold':
+                window.tail_angles_list.clear()
+                window.set_initial_state()
+
+        for i in range(len(video_paths)):
+            window.video_paths[i] = video_paths[i]
+            window.videos[i]      = video_paths[i]
+
+        # switch between recordings. the first switch to each recording computes its derived signals
+        for name, repeat in [('item_selected_first', len(tail_angle_paths)), ('item_selected', args.repeat)]:
+            times = []
+            for i in range(repeat):
+                start_time = time.time()
+                window.tail_angles_list.setCurrentRow((window.selected_tail_angles + 1) % len(tail_angle_paths))
+                app.processEvents()
+                times.append(time.time() - start_time)
+
+            results[name] = summarize(times)
+
+        window.tail_angles_list.setCurrentRow(0)
+        app.processEvents()
+
+        viewbox  = window.tail_plot.vb
+        n_frames = min(args.frames, args.video_frames)
+
+        # fetch frames by moving the mouse over the trace, measuring the time until the frame is shown
+        for name, frame_nums in [('frame_fetch_sequential', np.arange(1, args.repeat + 1)), ('frame_fetch_random', random_state.randint(0, n_frames, args.repeat))]:
+            viewbox.setXRange(frame_nums.min()/float(gui.framerate), (frame_nums.max() + 1)/float(gui.framerate), padding=0.01)
+            app.processEvents()
+
+            times = []
+            for frame_num in frame_nums:
+                if frame_num == window.current_frame:
+                    continue
+
+                start_time = time.time()
+                window.mouse_moved(viewbox.mapViewToScene(gui.QPointF((frame_num + 0.5)/gui.framerate, 0)))
+                if wait_until(app, lambda: window.current_frame == frame_num):
+                    times.append(time.time() - start_time)
+
+            results[name] = summarize(times)
+
+        # fetch frames with every recording shown in grid mode, measuring the time until every pane shows the frame
+        window.grid_checkbox.setChecked(True)
+        window.tail_angles_list.selectAll()
+        app.processEvents()
+
+        times = []
+        for frame_num in random_state.randint(0, n_frames, args.repeat):
+            if frame_num == window.current_frame:
+                continue
+
+            start_time = time.time()
+            window.mouse_moved(viewbox.mapViewToScene(gui.QPointF((frame_num + 0.5)/gui.framerate, 0)))
+            if wait_until(app, lambda: window.current_frame == frame_num and all(pane.current_frame == frame_num for pane in window.grid_panes)):
+                times.append(time.time() - start_time)
+
+        results['frame_fetch_grid'] = summarize(times)
+
+        window.grid_checkbox.setChecked(False)
+        app.processEvents()
+
+        # add behaviors spread over the selected recording
+        store      = window.annotations[0]
+        duration   = (args.frames - 1)/float(gui.framerate)
+        bout_times = np.linspace(0, duration, args.annotations + 1)[:-1]
+        for bout_time in bout_times:
+            store.add(gui.behaviors[random_state.randint(len(gui.behaviors))], bout_time, bout_time + 0.5*duration/args.annotations)
+
+        # redraw the trace and behaviors at several zoom levels
+        for name, width in [('redraw_full', duration), ('redraw_10s', 10.0), ('redraw_1s', 1.0)]:
+            times = []
+            for i in range(args.repeat):
+                start = random_state.uniform(0, max(duration - width, 0))
+
+                start_time = time.time()
+                viewbox.setXRange(start, start + width, padding=0)
+                window.graph_widget.viewport().repaint()
+                times.append(time.time() - start_time)
+
+            results[name] = summarize(times)
+
+        # find the behavior under the mouse
+        times = []
+        for bout_time in random_state.uniform(0, duration, args.repeat):
+            start_time = time.time()
+            store.at(bout_time)
+            times.append(time.time() - start_time)
+
+        results['hit_test'] = summarize(times)
+
+        # drag the start of a behavior that is in view
+        viewbox.setXRange(0, 10*duration/args.annotations, padding=0)
+        app.processEvents()
+
+        annotation = sorted(window.shown_annotations, key=lambda annotation: annotation.start_time)[0]
+        start      = annotation.start_time
+
+        times = []
+        for offset in np.linspace(-0.01, 0.01, args.repeat):
+            start_time = time.time()
+            annotation.items[0].setValue(start + offset)
+            times.append(time.time() - start_time)
+
+        results['drag'] = summarize(times)
+
+        # save every recording, and then only the one that changed
+        results_directory = os.path.join(directory, "results")
+        os.makedirs(results_directory)
+
+        gui.QFileDialog.getExistingDirectory = staticmethod(lambda *args: results_directory)
+
+        window.wait_for_autosave()
+        window.autosave_timer.stop()
+
+        start_time = time.time()
+        window.save_results()
+        results['save_results_all'] = summarize([time.time() - start_time])
+
+        annotation.items[0].setValue(start)
+
+        start_time = time.time()
+        window.save_results()
+        results['save_results_changed'] = summarize([time.time() - start_time])
+
+        window.close()
+    finally:
+        sys.stdout = stdout
+
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    output = {
+        'parameters': vars(args),
+        'platform':   platform.platform(),
+        'python':     platform.python_version(),
+        'numpy':      np.__version__,
+        'time':       time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'results':    results
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(output, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+import warnings
+import numpy as np
+
+class NearestNeighborLabeler(object):
+    # k-nearest neighbour classifier of bout features. there is no training: labeled examples are
+    # only added or removed, so new labels are used as soon as they arrive. nothing is predicted until
+    # every class has at least min_examples examples (and at least k), since a few examples would
+    # otherwise outvote the rest and label everything
+    def __init__(self, classes, k=5, batch_size=1024, min_examples=None):
+        self.classes      = list(classes)
+        self.k            = k
+        self.batch_size   = batch_size
+        self.min_examples = k if min_examples is None else max(min_examples, k)
+
+        self.keys     = []
+        self.examples = None
+        self.labels   = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, keys, features, labels):
+        # make the examples match the given ones. keys identify examples (eg. recording, label and times),
+        # and only the features of keys that weren't given last time are copied
+        features = np.asarray(features, dtype=np.float64).reshape((len(keys), -1))
+
+        if self.examples is None:
+            self.examples = np.zeros((0, features.shape[1]))
+
+        rows = dict(zip(self.keys, range(len(self.keys))))
+
+        kept = [ rows[key] for key in keys if key in rows ]
+        new  = [ i for i, key in enumerate(keys) if key not in rows ]
+
+        if len(new) == 0 and len(kept) == len(self.keys):
+            return
+
+        self.examples = np.concatenate((self.examples[kept], features[new]))
+        self.labels   = np.concatenate((self.labels[kept], [ self.classes.index(labels[i]) for i in new ])).astype(np.int64)
+        self.keys     = [ self.keys[row] for row in kept ] + [ keys[i] for i in new ]
+
+    def missing_examples(self):
+        # return the classes with fewer than min_examples examples
+        counts = np.bincount(self.labels, minlength=len(self.classes))
+
+        return [ self.classes[i] for i in range(len(self.classes)) if counts[i] < self.min_examples ]
+
+    def predict(self, features):
+        # return the most common label among the nearest examples of each row of features, and the fraction
+        # of those examples that have it. rows are labeled None while there are too few examples
+        features = np.asarray(features, dtype=np.float64).reshape((len(features), -1))
+
+        if len(self.missing_examples()) > 0 or len(features) == 0:
+            return [ None ]*len(features), np.zeros(len(features))
+
+        # scale features to unit variance, and treat unknown features as average
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            mean = np.nan_to_num(np.nanmean(self.examples, axis=0))
+            std  = np.nan_to_num(np.nanstd(self.examples, axis=0))
+
+        std[std == 0] = 1
+
+        examples = np.nan_to_num((self.examples - mean)/std)
+        squared  = np.sum(examples**2, axis=1)
+
+        k          = min(self.k, len(self.keys))
+        labels     = np.zeros(len(features), dtype=np.int64)
+        confidence = np.zeros(len(features))
+
+        # compute distances in batches to bound the memory used
+        for start in range(0, len(features), self.batch_size):
+            batch     = np.nan_to_num((features[start:start+self.batch_size] - mean)/std)
+            distances = np.sum(batch**2, axis=1)[:, np.newaxis] + squared[np.newaxis, :] - 2*np.dot(batch, examples.T)
+
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            votes   = np.sum(self.labels[nearest][:, :, np.newaxis] == np.arange(len(self.classes)), axis=1)
+
+            labels[start:start+self.batch_size]     = np.argmax(votes, axis=1)
+            confidence[start:start+self.batch_size] = np.max(votes, axis=1)/float(k)
+
+        return [ self.classes[label] for label in labels ], confidence
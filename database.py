@@ -0,0 +1,223 @@
+import os
+import sys
+import csv
+import glob
+import time
+import sqlite3
+import argparse
+import itertools
+
+from annotations import Annotation
+from results import video_name, behaviors_path, save_behaviors, load_behaviors
+
+# behaviors of many recordings in one SQLite database, so that they can be queried across an experiment without
+# reading a file per recording. the database is in WAL mode, so that several annotators can read it while one of
+# them writes, and the behaviors of any number of recordings are written in one transaction
+
+# time to wait for another annotator's write to finish before giving up (s)
+busy_timeout = 30.0
+
+schema = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id   INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS behaviors (
+    recording_id INTEGER NOT NULL REFERENCES recordings (id) ON DELETE CASCADE,
+    label        TEXT NOT NULL,
+    start_time   REAL NOT NULL,
+    end_time     REAL NOT NULL,
+    proposed     INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS behaviors_by_recording ON behaviors (recording_id, start_time);
+CREATE INDEX IF NOT EXISTS behaviors_by_label ON behaviors (label, end_time - start_time);
+"""
+
+class AnnotationDatabase(object):
+    # recordings are identified by the absolute path of their tail angle file, so that a recording is the same
+    # whichever folder its path was given from. a connection is opened for every operation, so that the
+    # database can be used from any thread
+    def __init__(self, path):
+        self.path = path
+
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(schema)
+        finally:
+            connection.close()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None)
+        connection.execute("PRAGMA foreign_keys=ON")
+
+        # in WAL mode, this only risks losing the last transactions on power loss, never corrupting the database
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        return connection
+
+    def save_recordings(self, recordings):
+        # replace the behaviors of recordings, given as (tail angle path, annotations). either every recording
+        # is saved or none is, and readers never see some of them saved
+        connection = self.connect()
+        try:
+            # take the write lock up front, so that two annotators saving at once wait for each other instead of failing
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                for tail_angle_path, annotations in recordings:
+                    tail_angle_path = os.path.abspath(tail_angle_path)
+
+                    connection.execute("INSERT OR IGNORE INTO recordings (path, name) VALUES (?, ?)", (tail_angle_path, video_name(tail_angle_path)))
+                    recording_id = connection.execute("SELECT id FROM recordings WHERE path = ?", (tail_angle_path,)).fetchone()[0]
+
+                    connection.execute("DELETE FROM behaviors WHERE recording_id = ?", (recording_id,))
+                    connection.executemany("INSERT INTO behaviors (recording_id, label, start_time, end_time, proposed) VALUES (?, ?, ?, ?, ?)",
+                                           [ (recording_id, annotation.label, annotation.start_time, annotation.end_time, int(annotation.proposed)) for annotation in annotations ])
+
+                connection.execute("COMMIT")
+            except:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+
+    def recordings(self):
+        connection = self.connect()
+        try:
+            return [ str(path) for path, in connection.execute("SELECT path FROM recordings ORDER BY path") ]
+        finally:
+            connection.close()
+
+    def load_recordings(self, tail_angle_paths):
+        # return a dictionary of the behaviors of the recordings that are in the database, as lists of
+        # (label, start time, end time, proposed) in order of start time, keyed by the paths as they were given
+        paths = { os.path.abspath(tail_angle_path): tail_angle_path for tail_angle_path in tail_angle_paths }
+
+        return { paths[tail_angle_path]: [ (label, start_time, end_time, proposed) for _, label, start_time, end_time, proposed in rows ]
+                 for tail_angle_path, rows in itertools.groupby(self.query(tail_angle_paths=tail_angle_paths), key=lambda row: row[0]) }
+
+    def query(self, labels=None, min_duration=None, max_duration=None, tail_angle_paths=None, start_time=None, end_time=None):
+        # return the behaviors matching every given condition as (tail angle path, label, start time, end time, proposed),
+        # ordered by recording and start time. behaviors match a time range if they overlap it
+        conditions = []
+        parameters = []
+
+        if labels is not None:
+            conditions.append("behaviors.label IN ({})".format(", ".join("?"*len(labels))))
+            parameters += list(labels)
+        if min_duration is not None:
+            conditions.append("behaviors.end_time - behaviors.start_time >= ?")
+            parameters.append(min_duration)
+        if max_duration is not None:
+            conditions.append("behaviors.end_time - behaviors.start_time <= ?")
+            parameters.append(max_duration)
+        if start_time is not None:
+            conditions.append("behaviors.end_time >= ?")
+            parameters.append(start_time)
+        if end_time is not None:
+            conditions.append("behaviors.start_time <= ?")
+            parameters.append(end_time)
+
+        connection = self.connect()
+        try:
+            tables = "behaviors JOIN recordings ON recordings.id = behaviors.recording_id"
+
+            # recordings are given in a temporary table, since there can be more of them than parameters allowed in a query
+            if tail_angle_paths is not None:
+                connection.execute("CREATE TEMP TABLE selected_recordings (path TEXT PRIMARY KEY)")
+                connection.executemany("INSERT OR IGNORE INTO selected_recordings (path) VALUES (?)", [ (os.path.abspath(tail_angle_path),) for tail_angle_path in tail_angle_paths ])
+
+                tables += " JOIN selected_recordings ON selected_recordings.path = recordings.path"
+
+            if len(conditions) > 0:
+                tables += " WHERE " + " AND ".join(conditions)
+
+            rows = connection.execute("SELECT recordings.path, behaviors.label, behaviors.start_time, behaviors.end_time, behaviors.proposed FROM {} "
+                                      "ORDER BY recordings.path, behaviors.start_time".format(tables), parameters).fetchall()
+
+            return [ (str(path), str(label), start_time, end_time, bool(proposed)) for path, label, start_time, end_time, proposed in rows ]
+        finally:
+            connection.close()
+
+    def export_behaviors(self, directory, tail_angle_paths=None, mark_proposed=False):
+        # save the behaviors of recordings in the database as *_behaviors.csv files, returning the number of files
+        rows = self.query(tail_angle_paths=tail_angle_paths)
+
+        n_files = 0
+        for tail_angle_path, recording_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            save_behaviors(behaviors_path(directory, tail_angle_path), [ Annotation(label, start_time, end_time, proposed) for _, label, start_time, end_time, proposed in recording_rows ], mark_proposed=mark_proposed)
+            n_files += 1
+
+        return n_files
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Keep the behaviors of many recordings in an SQLite database, and query or export them.")
+    parser.add_argument('database', help="database file, which is created if it doesn't exist")
+    commands = parser.add_subparsers(dest='command')
+
+    import_parser = commands.add_parser('import', help="add the *_behaviors.csv files of the tail angle files in a folder, replacing their behaviors in the database")
+    import_parser.add_argument('directory', help="folder containing the tail angle files")
+    import_parser.add_argument('--results', help="folder containing the behavior files (default: the tail angle folder)")
+
+    query_parser = commands.add_parser('query', help="print matching behaviors as CSV, eg. \"query --label C-Bend --min-duration 0.05\"")
+    query_parser.add_argument('--label', action='append', help="label of the behaviors (can be given several times)")
+    query_parser.add_argument('--min-duration', type=float, help="minimum duration of the behaviors (s)")
+    query_parser.add_argument('--max-duration', type=float, help="maximum duration of the behaviors (s)")
+    query_parser.add_argument('--start-time', type=float, help="only behaviors ending after this time (s)")
+    query_parser.add_argument('--end-time', type=float, help="only behaviors starting before this time (s)")
+    query_parser.add_argument('--output', help="file to write the behaviors to (default: print them)")
+
+    export_parser = commands.add_parser('export', help="save the behaviors of every recording in the database as *_behaviors.csv files")
+    export_parser.add_argument('directory', help="folder where the behavior files are saved")
+    export_parser.add_argument('--mark-proposed', action='store_true', help="add a Proposed column marking the behaviors that haven't been reviewed")
+    args = parser.parse_args(args)
+
+    database   = AnnotationDatabase(args.database)
+    start_time = time.time()
+
+    if args.command == 'import':
+        results_directory = args.results or args.directory
+
+        recordings = []
+        for tail_angle_path in sorted(glob.glob(os.path.join(args.directory, '*_tail_angles.csv'))):
+            path = behaviors_path(results_directory, tail_angle_path)
+
+            if os.path.exists(path):
+                recordings.append((tail_angle_path, [ Annotation(label, behavior_start_time, behavior_end_time, proposed) for label, behavior_start_time, behavior_end_time, proposed in load_behaviors(path) ]))
+
+        database.save_recordings(recordings)
+
+        print("Imported the behaviors of {} recordings in {:.2f} s.".format(len(recordings), time.time() - start_time))
+    elif args.command == 'query':
+        rows = database.query(labels=args.label, min_duration=args.min_duration, max_duration=args.max_duration, start_time=args.start_time, end_time=args.end_time)
+
+        file   = open(args.output, 'w') if args.output is not None else sys.stdout
+        writer = csv.writer(file, delimiter=',')
+        writer.writerow(['Recording', 'Behavior', 'Start Time (s)', 'End Time (s)', 'Proposed'])
+        for tail_angle_path, label, behavior_start_time, behavior_end_time, proposed in rows:
+            writer.writerow([video_name(tail_angle_path), label, str(behavior_start_time), str(behavior_end_time), str(proposed)])
+
+        if args.output is not None:
+            file.close()
+
+        # the count goes to stderr, so that only the behaviors are printed to stdout
+        sys.stderr.write("Found {} behaviors in {:.3f} s.\n".format(len(rows), time.time() - start_time))
+    elif args.command == 'export':
+        if not os.path.exists(args.directory):
+            os.makedirs(args.directory)
+
+        n_files = database.export_behaviors(args.directory, mark_proposed=args.mark_proposed)
+
+        print("Exported the behaviors of {} recordings to '{}' in {:.2f} s.".format(n_files, args.directory, time.time() - start_time))
+    else:
+        parser.print_help()
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
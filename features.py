@@ -0,0 +1,134 @@
+import warnings
+import numpy as np
+
+# kinematic features of a bout. angles are in the units of the tail angle files
+feature_names = [
+    'duration',       # s
+    'peak_tip_angle', # largest absolute tip angle
+    'mean_tip_angle', # mean absolute tip angle
+    'beat_count',     # number of full tail beats, counted from midline crossings of the tip
+    'beat_frequency', # tail beats per s
+    'laterality',     # from -1 (only negative tip angles) to 1 (only positive tip angles)
+    'curvature'       # mean absolute angle between neighbouring segments
+]
+
+def annotation_frames(annotations, framerate):
+    # return the first frames and the frames after the last frames of annotations
+    bounds = np.array([ annotation.bounds() for annotation in annotations ], dtype=float).reshape((-1, 2))
+
+    starts = np.round(bounds[:, 0]*framerate).astype(np.int64)
+    ends   = np.round(bounds[:, 1]*framerate).astype(np.int64) + 1
+
+    return starts, ends
+
+def bout_indices(starts, ends):
+    # return the frames of all bouts one after the other, and where each bout starts in them
+    lengths = ends - starts
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    indices = np.arange(np.sum(lengths), dtype=np.int64) - np.repeat(offsets - starts, lengths)
+
+    return indices, offsets
+
+def compute_bout_features(tail_angles, tip_angles, starts, ends, framerate):
+    # compute the features of many bouts at once. every feature is reduced over the frames of all
+    # bouts in a single call, so the time taken hardly depends on the number of bouts
+    features = { name: np.zeros(len(starts)) for name in feature_names }
+
+    if len(starts) == 0:
+        return features
+
+    # keep bouts inside the recording and at least one frame long
+    starts = np.clip(starts, 0, len(tip_angles) - 1)
+    ends   = np.clip(np.maximum(ends, starts + 1), 1, len(tip_angles))
+
+    indices, offsets = bout_indices(starts, ends)
+
+    tip   = np.asarray(tip_angles[indices], dtype=np.float64)
+    valid = ~np.isnan(tip)
+    tip_0 = np.where(valid, tip, 0)
+
+    # a crossing is counted at the first of the two frames, unless the second frame belongs to the next bout
+    crossing = np.zeros(len(tip), dtype=bool)
+    crossing[:-1] = (np.signbit(tip_0[1:]) != np.signbit(tip_0[:-1])) & valid[1:] & valid[:-1]
+    crossing[offsets[1:] - 1] = False
+
+    with warnings.catch_warnings():
+        # bouts where the tail wasn't tracked have NaN features
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+
+        n_valid    = np.add.reduceat(valid, offsets).astype(np.float64)
+        abs_sum    = np.add.reduceat(np.abs(tip_0), offsets)
+        signed_sum = np.add.reduceat(tip_0, offsets)
+
+        features['duration']       = (ends - starts)/float(framerate)
+        features['peak_tip_angle'] = np.fmax.reduceat(np.abs(tip), offsets)
+        features['mean_tip_angle'] = abs_sum/n_valid
+        features['beat_count']     = np.add.reduceat(crossing, offsets)/2.0
+        features['beat_frequency'] = features['beat_count']/features['duration']
+        features['laterality']     = signed_sum/abs_sum
+
+        # curvature of each frame along the segments, averaged over the frames where it is known
+        curvature       = np.nanmean(np.abs(np.diff(np.asarray(tail_angles[indices], dtype=np.float64), axis=1)), axis=1)
+        curvature_valid = ~np.isnan(curvature)
+
+        features['curvature'] = np.add.reduceat(np.where(curvature_valid, curvature, 0), offsets)/np.add.reduceat(curvature_valid, offsets)
+
+    return features
+
+class BoutFeatureTable(object):
+    # features of the bouts of a recording, stored as one array per feature. bouts are identified
+    # by their boundaries, so features are only computed for bouts that are new or were moved
+    def __init__(self, tip_angles, get_tail_angles, framerate):
+        self.tip_angles      = tip_angles
+        self.get_tail_angles = get_tail_angles
+        self.framerate       = framerate
+
+        self.keys    = np.zeros(0, dtype=np.int64)
+        self.columns = { name: np.zeros(0) for name in feature_names }
+
+        self.n_computed = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, starts, ends):
+        # make the table hold the features of the given bouts, in the given order, and return its columns
+        starts = np.asarray(starts, dtype=np.int64)
+        ends   = np.asarray(ends, dtype=np.int64)
+        keys   = starts*(len(self.tip_angles) + 1) + ends
+
+        # find bouts that are already in the table
+        order     = np.argsort(self.keys)
+        positions = np.clip(np.searchsorted(self.keys[order], keys), 0, max(len(self.keys) - 1, 0))
+        if len(self.keys) > 0:
+            rows  = order[positions]
+            found = self.keys[rows] == keys
+        else:
+            rows  = positions
+            found = np.zeros(len(keys), dtype=bool)
+
+        new = ~found
+
+        if np.any(new):
+            new_features = compute_bout_features(self.get_tail_angles(), self.tip_angles, starts[new], ends[new], self.framerate)
+
+            self.n_computed += int(np.sum(new))
+        else:
+            new_features = None
+
+        columns = {}
+        for name in feature_names:
+            column        = np.zeros(len(keys))
+            column[found] = self.columns[name][rows[found]]
+            if new_features is not None:
+                column[new] = new_features[name]
+            columns[name] = column
+
+        self.keys    = keys
+        self.columns = columns
+
+        return self.columns
+
+    def rows(self):
+        # return the features of each bout as a 2D array, with columns in the order of feature_names
+        return np.column_stack([ self.columns[name] for name in feature_names ]).reshape((len(self.keys), len(feature_names)))
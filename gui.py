@@ -1,21 +1,48 @@
 import sys
-import pyqtgraph as pg
-import numpy as np
-import cv2
+import time
+
+from profiling import profiler, profiled, startup_profiler, LazyModule
+
+with startup_profiler.step("import numpy"):
+    import numpy as np
+
 import os
 import glob
-import csv
+import sqlite3
+import multiprocessing
+import threading
 
-# import the Qt library
 try:
-    from PyQt4.QtCore import *
-    from PyQt4.QtGui import *
-    pyqt_version = 4
-except:
-    from PyQt5.QtCore import *
-    from PyQt5.QtGui import *
-    from PyQt5.QtWidgets import *
-    pyqt_version = 5
+    import queue
+except ImportError:
+    import Queue as queue
+
+with startup_profiler.step("import modules"):
+    from tail_angles import framerate, cache_key, preload_tail_angles, TailAngleStore
+    from video import VideoPool, Playback
+    from signals import load_derived_signals
+    from annotations import Annotation, AnnotationStore
+    from results import behaviors_path, features_path, save_behaviors, save_features, load_behaviors
+    from features import annotation_frames, BoutFeatureTable
+    from classifier import NearestNeighborLabeler
+    from project import save_project, load_project, missing_files
+    from segmentation import default_parameters, segment_bouts
+    from database import AnnotationDatabase
+
+# import the Qt library
+with startup_profiler.step("import PyQt"):
+    try:
+        from PyQt4.QtCore import *
+        from PyQt4.QtGui import *
+        pyqt_version = 4
+    except:
+        from PyQt5.QtCore import *
+        from PyQt5.QtGui import *
+        from PyQt5.QtWidgets import *
+        pyqt_version = 5
+
+# pyqtgraph takes long to import, so it is only imported once the window has been shown
+pg = LazyModule('pyqtgraph')
 
 # set styles of title and subtitle labels
 ROUNDED_STYLESHEET_DARK    = "background-color: rgba(0, 0, 0, 0.3); border-radius: 2px; border: 1px solid rgba(0, 0, 0, 0.5); padding: 2px;"
@@ -29,7 +56,69 @@ behaviors = ["J-Turn", "C-Bend", "Swim"]
 
 colors = [(255, 100, 0), (0, 100, 255), (100, 0, 255)]
 
-framerate = 349
+# maximum size of tail angle arrays kept in memory at once (MB)
+tail_angle_memory_budget = 2000
+
+# maximum size of the decoded frames cached for each video (MB)
+frame_cache_size = 500
+
+# maximum number of videos that are kept open at once
+max_open_videos = 16
+
+# time the mouse has to rest before a full resolution frame is shown for videos with a proxy (ms)
+proxy_rest_time = 200
+
+# maximum number of behaviors that are drawn at once
+max_shown_behaviors = 200
+
+# time without edits after which changed recordings are saved in the background (ms)
+autosave_delay = 2000
+
+# directory where changed recordings are saved until a results directory is chosen. files are named by the same
+# hash of the tail angle path as the cache, so that recordings with the same name in different folders don't collide
+autosave_directory = os.path.join(os.path.expanduser("~"), ".behavior_classification", "autosave")
+
+# file the trace of timed stages is written to when quitting with profiling enabled
+profile_trace_path = "profile_trace.json"
+
+# number of labeled behaviors that vote on the label of a proposed behavior when auto-labeling
+auto_label_neighbors = 5
+
+# playback speeds, as a fraction of the frame rate of the recordings
+playback_speeds = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0]
+
+# number of frames decoded ahead of the playback cursor
+playback_buffer_size = 32
+
+# SQLite database that behaviors are loaded from and saved to along with the results files, if any.
+# it can be shared by several annotators, eg. "python gui.py --database /path/to/behaviors.sqlite"
+annotation_database_path = None
+
+# maximum number of recordings shown below the selected one in grid mode
+max_grid_panes = 8
+
+# whether to print the time taken by each step of starting up
+profile_startup = False
+
+startup_profiler.mark("imports")
+
+class GridPane(object):
+    # a recording shown below the selected one in grid mode, with its video and its tail trace on the same time axis
+    def __init__(self, tail_angle_path, n_frames):
+        self.tail_angle_path = tail_angle_path
+        self.n_frames        = n_frames
+
+        self.viewbox = None
+        self.image   = None
+        self.plot    = None
+        self.curve   = None
+        self.pyramid = None
+        self.line    = None
+
+        self.current_frame   = -1
+        self.requested_frame = -1
+        self.proxy_frame     = None
+        self.playback        = None
 
 class Window(QMainWindow):
     def __init__(self):
@@ -41,13 +130,10 @@ class Window(QMainWindow):
 
         # set colors
         self.bg_color = (self.palette().color(self.backgroundRole()).red(), self.palette().color(self.backgroundRole()).green(), self.palette().color(self.backgroundRole()).blue())
-        pg.setConfigOption('background', self.bg_color)
         if self.bg_color[0] < 100:
             rounded_stylesheet   = ROUNDED_STYLESHEET_DARK
-            pg.setConfigOption('foreground', (150, 150, 150))
         else:
             rounded_stylesheet   = ROUNDED_STYLESHEET_LIGHT
-            pg.setConfigOption('foreground', (20, 20, 20))
 
         # create main layout
         self.main_layout = QVBoxLayout(self.main_widget)
@@ -57,31 +143,19 @@ class Window(QMainWindow):
         self.splitter = QSplitter(Qt.Vertical)
         self.main_layout.addWidget(self.splitter)
 
-        # create plot widget
+        # create plot widget. the plots are created once the window has been shown
         self.plot_widget = QWidget(self)
         self.plot_layout = QHBoxLayout(self.plot_widget)
         self.plot_layout.setContentsMargins(0, 0, 0, 0)
         self.splitter.addWidget(self.plot_widget)
 
-        self.graph_widget = pg.GraphicsLayoutWidget()
-        # self.graph_widget.setMaximumHeight(300)
-        self.graph_widget.scene().sigMouseClicked.connect(self.plot_clicked)
-        self.graph_widget.scene().sigMouseMoved.connect(self.mouse_moved)
-        self.graph_widget.ci.layout.setColumnStretchFactor(0, 2)
-        self.graph_widget.ci.layout.setColumnStretchFactor(1, 4)
-        self.plot_layout.addWidget(self.graph_widget)
+        self.deferred_widgets_scheduled = False
+        self.deferred_widgets_created   = False
 
-        # create video preview plot
-        self.video_viewbox = self.graph_widget.addViewBox(lockAspect=True, name='video_plot', border=None, row=0, col=0, invertY=True)
-        self.video_plot = pg.ImageItem()
-        self.video_viewbox.addItem(self.video_plot)
+        self.grid_panes = []
 
-        # create tail trace plot
-        self.tail_plot = self.graph_widget.addPlot(name='tail_plot', row=0, col=1)
-        self.tail_plot.setLabel('left', "Tail Angle")
-        self.tail_plot.setLabel('bottom', "Time (s)")
-        self.tail_plot.showButtons()
-        self.tail_plot.setMouseEnabled(x=True,y=False)
+        # graphics items of behaviors that are out of view are hidden and kept here to be reused
+        self.behavior_item_pool = []
 
         # create bottom widget
         self.bottom_widget = QWidget()
@@ -100,11 +174,69 @@ class Window(QMainWindow):
         self.delete_tail_angles_shortcut = QShortcut(QKeySequence('Delete'), self.tail_angles_list)
         self.delete_tail_angles_shortcut.activated.connect(self.delete_selected_tail_angles)
 
+        startup_profiler.mark("window.layout")
+
+        # create bout detection widget
+        self.detection_widget = QWidget()
+        self.detection_layout = QHBoxLayout(self.detection_widget)
+        self.detection_layout.setContentsMargins(0, 0, 0, 0)
+        self.bottom_layout.addWidget(self.detection_widget)
+
+        # create button to propose behaviors for the bouts found in the selected tail angles
+        self.detect_bouts_button = QPushButton('Detect Bouts')
+        self.detect_bouts_button.clicked.connect(self.detect_bouts)
+        self.detection_layout.addWidget(self.detect_bouts_button)
+
+        # create boxes for the detection parameters. changing a parameter detects the bouts again
+        self.detection_boxes = {}
+
+        for name, label, maximum in [('velocity_threshold', 'Velocity Threshold:', 100000), ('smoothing_time', 'Smoothing (ms):', 1000), ('min_duration', 'Min. Duration (ms):', 10000),
+                                     ('max_gap', 'Max. Gap (ms):', 10000), ('c_bend_angle', 'C-Bend Angle:', 1000)]:
+            box = QDoubleSpinBox()
+            box.setDecimals(1)
+            box.setRange(0, maximum)
+            box.setValue(default_parameters[name])
+            box.valueChanged.connect(self.detection_parameters_changed)
+            self.detection_boxes[name] = box
+
+            self.detection_layout.addWidget(QLabel(label))
+            self.detection_layout.addWidget(box)
+
+        # create checkbox to label proposed behaviors like the most similar labeled behaviors
+        self.auto_label_checkbox = QCheckBox('Auto-Label')
+        self.auto_label_checkbox.stateChanged.connect(self.auto_label_checked)
+        self.detection_layout.addWidget(self.auto_label_checkbox)
+
+        self.detection_layout.addStretch()
+
+        # create button to play the video of the selected tail angles from the current frame, and box for the speed
+        self.play_button = QPushButton('Play')
+        self.play_button.setCheckable(True)
+        self.play_button.setShortcut(QKeySequence(Qt.Key_Space))
+        self.play_button.toggled.connect(self.play_toggled)
+        self.detection_layout.addWidget(self.play_button)
+
+        self.playback_speed_box = QComboBox()
+        self.playback_speed_box.addItems([ "{:g}x".format(speed) for speed in playback_speeds ])
+        self.playback_speed_box.setCurrentIndex(playback_speeds.index(0.1))
+        self.playback_speed_box.currentIndexChanged.connect(self.playback_speed_changed)
+        self.detection_layout.addWidget(self.playback_speed_box)
+
+        # create checkbox to show the other selected recordings below the selected one, following the same cursor
+        self.grid_checkbox = QCheckBox('Grid')
+        self.grid_checkbox.toggled.connect(self.grid_toggled)
+        self.detection_layout.addWidget(self.grid_checkbox)
+
         # create button widget
         self.button_widget = QWidget()
         self.button_layout = QHBoxLayout(self.button_widget)
         self.bottom_layout.addWidget(self.button_widget)
 
+        # create button to open a project
+        self.open_project_button = QPushButton('Open Project...')
+        self.open_project_button.clicked.connect(self.open_project)
+        self.button_layout.addWidget(self.open_project_button)
+
         # create button to add tail angles
         self.add_tail_angles_button = QPushButton('Add Tail Angles...')
         self.add_tail_angles_button.setStyleSheet('font-weight: bold;')
@@ -154,6 +286,17 @@ class Window(QMainWindow):
         self.save_results_button.clicked.connect(self.save_results)
         self.button_layout.addWidget(self.save_results_button)
 
+        # create checkbox to also save the features of the bouts when saving results
+        self.save_features_checkbox = QCheckBox('Bout Features')
+        self.button_layout.addWidget(self.save_features_checkbox)
+
+        # create button to save a project
+        self.save_project_button = QPushButton('Save Project...')
+        self.save_project_button.setIcon(QIcon("icons/save_icon.png"))
+        self.save_project_button.setIconSize(QSize(16,16))
+        self.save_project_button.clicked.connect(self.save_project)
+        self.button_layout.addWidget(self.save_project_button)
+
         # set main widget
         self.setCentralWidget(self.main_widget)
 
@@ -163,6 +306,107 @@ class Window(QMainWindow):
         else:
             self.setWindowFlags(Qt.CustomizeWindowHint | Qt.WindowCloseButtonHint | Qt.WindowMinimizeButtonHint | Qt.WindowMaximizeButtonHint)
 
+        startup_profiler.mark("window.controls")
+
+        # create timer that shows the latest requested video frame, at most once per screen refresh
+        if pyqt_version == 5:
+            refresh_rate = QApplication.primaryScreen().refreshRate()
+        else:
+            refresh_rate = 60
+
+        self.refresh_rate = refresh_rate
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(int(1000/refresh_rate))
+        self.frame_timer.timeout.connect(self.show_requested_frame)
+
+        # create timer that shows frames during playback. it checks twice per frame, since frames are due at
+        # fixed times rather than a fixed time after the last one was shown
+        self.playback_timer = QTimer(self)
+        if pyqt_version == 5:
+            self.playback_timer.setTimerType(Qt.PreciseTimer)
+        self.playback_timer.timeout.connect(self.show_playback_frame)
+        self.playback = None
+
+        # create timer that requests the full resolution frame once the mouse rests, for videos with a proxy
+        self.rest_timer = QTimer(self)
+        self.rest_timer.setSingleShot(True)
+        self.rest_timer.setInterval(proxy_rest_time)
+        self.rest_timer.timeout.connect(self.request_full_frame)
+
+        self.request_time = 0.0
+        self.frames_shown = 0
+
+        # create timer that saves changed recordings once edits stop
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(autosave_delay)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_thread = None
+
+        if annotation_database_path is not None:
+            self.database = AnnotationDatabase(annotation_database_path)
+        else:
+            self.database = None
+        
+        self.set_initial_state()
+
+        startup_profiler.mark("window.state")
+
+        self.show()
+
+        startup_profiler.mark("window.show")
+
+    def paintEvent(self, event):
+        QMainWindow.paintEvent(self, event)
+
+        # create the rest of the window once it has been painted for the first time
+        if not self.deferred_widgets_scheduled:
+            self.deferred_widgets_scheduled = True
+
+            startup_profiler.mark("first paint")
+
+            QTimer.singleShot(0, self.create_deferred_widgets)
+
+    def create_deferred_widgets(self):
+        # create the widgets that aren't needed to show the window. this is called once the window has been painted
+        if self.deferred_widgets_created:
+            return
+
+        self.deferred_widgets_created = True
+
+        # set colors
+        pg.setConfigOption('background', self.bg_color)
+        if self.bg_color[0] < 100:
+            pg.setConfigOption('foreground', (150, 150, 150))
+        else:
+            pg.setConfigOption('foreground', (20, 20, 20))
+
+        self.graph_widget = pg.GraphicsLayoutWidget()
+        # self.graph_widget.setMaximumHeight(300)
+        self.graph_widget.scene().sigMouseClicked.connect(self.plot_clicked)
+        self.graph_widget.scene().sigMouseMoved.connect(self.mouse_moved)
+        self.graph_widget.ci.layout.setColumnStretchFactor(0, 2)
+        self.graph_widget.ci.layout.setColumnStretchFactor(1, 4)
+        self.plot_layout.addWidget(self.graph_widget)
+
+        # create video preview plot
+        self.video_viewbox = self.graph_widget.addViewBox(lockAspect=True, name='video_plot', border=None, row=0, col=0, invertY=True)
+        self.video_plot = pg.ImageItem()
+        self.video_viewbox.addItem(self.video_plot)
+
+        # create tail trace plot
+        self.tail_plot = self.graph_widget.addPlot(name='tail_plot', row=0, col=1)
+        self.tail_plot.setLabel('left', "Tail Angle")
+        self.tail_plot.setLabel('bottom', "Time (s)")
+        self.tail_plot.showButtons()
+        self.tail_plot.setMouseEnabled(x=True,y=False)
+        self.tail_plot.vb.sigXRangeChanged.connect(self.update_tail_curve)
+        self.tail_plot.vb.sigResized.connect(self.update_tail_curve)
+        self.tail_plot.vb.sigXRangeChanged.connect(self.update_shown_behaviors)
+
+        startup_profiler.mark("window.plots")
+
         # create menu
         self.menu = QMenu(self.main_widget)
 
@@ -176,48 +420,101 @@ class Window(QMainWindow):
         self.menu.addAction(delete_action)
 
         self.menu.triggered.connect(self.action_chosen)
-        
-        self.set_initial_state()
 
-        self.show()
+        # create overlay showing how fast the preview is, when profiling
+        if profiler.enabled:
+            self.profile_label = QLabel(self.graph_widget)
+            self.profile_label.setStyleSheet(ROUNDED_STYLESHEET_DARK + " color: white;")
+            self.profile_label.move(10, 10)
+            self.profile_label.show()
+
+            self.profile_time         = time.time()
+            self.profile_frames_shown = 0
+
+            self.profile_timer = QTimer(self)
+            self.profile_timer.timeout.connect(self.update_profile_overlay)
+            self.profile_timer.start(500)
+
+        startup_profiler.mark("window.menu")
+
+        if profile_startup:
+            print(startup_profiler.report())
 
     def set_initial_state(self):
         self.behavior_start_time    = None
         self.behavior_end_time      = None
-        self.behavior_times         = []
-        self.tail_angles            = []
+        self.annotations            = []
+        self.tail_angles            = TailAngleStore(memory_budget=tail_angle_memory_budget)
         self.tail_angle_paths       = []
+        self.derived_signals        = []
+        self.feature_tables         = []
+        self.labeler                = NearestNeighborLabeler(behaviors, k=auto_label_neighbors)
+        self.results_directory      = None
+        self.saved_versions         = {}
         self.video_paths            = []
-        self.videos                 = []
-        self.behavior_items         = []
+        self.videos                 = VideoPool(max_open=max_open_videos, cache_size=frame_cache_size)
+        self.new_behavior_items     = []
+        self.shown_annotations      = set()
         self.selected_tail_angles   = 0
         self.preview_line_item      = None
-        self.behaviors              = []
-        self.selected_behavior      = 0
+        self.tail_curve             = None
+        self.tail_pyramid           = None
+        self.selected_behavior      = None
         self.current_frame          = 0
+        self.requested_frame        = 0
+        self.proxy_frame            = None
 
         self.setWindowTitle("")
 
-    def plot_tail_angles(self, tail_angles):
+    @profiled('plot_tail_angles')
+    def plot_tail_angles(self, signals):
         self.tail_plot.clear()
 
-        if tail_angles is not None:
-            one_frame    = 1.0/framerate
+        if signals is not None:
+            # only the part of the trace that is in view is drawn, from the level of the pyramid that matches the zoom level
+            self.tail_pyramid = signals.pyramid
 
-            x = np.linspace(0, tail_angles.shape[0]*one_frame, tail_angles.shape[0])
-            self.tail_plot.plot(x, np.nanmean(tail_angles[:, -3:], axis=1), pen=pg.mkPen((255, 0, 0, 255), width=2), autoDownsample=True)
-            self.tail_plot.vb.setLimits(xMin=0, xMax=x[-1])
-            self.tail_plot.vb.autoRange()
+            x_max        = (signals.n_frames-1)/float(framerate)
+            y_min, y_max = signals.min_tip_angle, signals.max_tip_angle
+
+            self.tail_curve = self.tail_plot.plot(pen=pg.mkPen((255, 0, 0, 255), width=2))
+            self.tail_plot.vb.setLimits(xMin=0, xMax=x_max)
+            self.tail_plot.vb.setRange(xRange=(0, x_max), yRange=(y_min, y_max))
+            self.tail_plot.vb.disableAutoRange()
+
+            self.update_tail_curve()
 
             return True
         else:
+            self.tail_curve   = None
+            self.tail_pyramid = None
+
             return False
 
+    @profiled('update_tail_curve')
+    def update_tail_curve(self):
+        if self.tail_curve is not None:
+            self.draw_tail_curve(self.tail_curve, self.tail_pyramid, self.tail_plot.vb)
+
+        for pane in self.grid_panes:
+            self.draw_tail_curve(pane.curve, pane.pyramid, pane.plot.vb)
+
+    def draw_tail_curve(self, curve, pyramid, viewbox):
+        x_min, x_max = viewbox.viewRange()[0]
+
+        # draw about two points per pixel
+        x, y = pyramid.get_window(int(x_min*framerate), int(np.ceil(x_max*framerate)), max_points=2*max(int(viewbox.width()), 100))
+
+        curve.setData(x/float(framerate), y, connect='finite')
+
+    @profiled('mouse_moved')
     def mouse_moved(self, position):
         # get x-y coordinates of where the mouse is
         items = self.graph_widget.scene().items(position)
-        if self.tail_plot in items:
-            pos = self.tail_plot.vb.mapSceneToView(position)
+        plots = [ plot for plot in [self.tail_plot] + [ pane.plot for pane in self.grid_panes ] if plot in items ]
+        if len(plots) > 0:
+            # the plots of grid mode share the time axis of the tail plot
+            pos = plots[0].vb.mapSceneToView(position)
 
             x = pos.x()
             y = pos.y()
@@ -225,30 +522,46 @@ class Window(QMainWindow):
             if self.preview_line_item is None:
                 self.preview_line_item = pg.InfiniteLine(pos=x, angle=90, pen=pg.mkPen((0, 0, 0, 100)))
                 self.tail_plot.vb.addItem(self.preview_line_item)
-            else:
+            elif self.playback is None:
+                # during playback, the line is the playback cursor
                 self.preview_line_item.setValue(x)
 
-            if len(self.videos) > 0 and self.videos[self.selected_tail_angles] is not None:
+            if self.playback is None and len(self.videos) > 0 and self.videos[self.selected_tail_angles] is not None:
                 frame_num = int(x*framerate)
 
-                if 0 <= frame_num < len(self.tail_angles[self.selected_tail_angles]) and frame_num != self.current_frame:
-                    capture = self.videos[self.selected_tail_angles]
+                # the video may be shorter than the tail angles, in which case its last frame is shown
+                video_n_frames = self.videos[self.selected_tail_angles].n_frames
+                if video_n_frames > 0:
+                    frame_num = min(frame_num, video_n_frames - 1)
+
+                if 0 <= frame_num < self.get_derived_signals(self.selected_tail_angles).n_frames and frame_num != self.requested_frame:
+                    # the frame is decoded in the background and shown by the frame timer, so that
+                    # requests made while the mouse moves quickly replace each other instead of queuing up.
+                    # videos with a proxy are scrubbed using the proxy until the mouse rests
+                    self.requested_frame = frame_num
+                    self.request_time    = time.time()
+
+                    if self.videos[self.selected_tail_angles].proxy is not None:
+                        self.rest_timer.start()
+                    else:
+                        self.videos[self.selected_tail_angles].request_frame(frame_num)
 
-                    if frame_num != self.current_frame+1:
-                        capture.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-                    _, frame = capture.read()
-                    frame = frame.transpose((1, 0, 2))
+                    if not self.frame_timer.isActive():
+                        self.frame_timer.start()
 
-                    self.video_plot.setImage(frame)
+            if self.playback is None:
+                for pane in self.grid_panes:
+                    pane.line.setValue(x)
 
-                    self.current_frame = frame_num
+                self.request_grid_frames(int(x*framerate))
 
             if self.behavior_start_time is not None:
-                if len(self.behavior_items[self.selected_tail_angles][-1]) > 1:
-                    behavior_rect_item = self.behavior_items[self.selected_tail_angles][-1][1]
+                if len(self.new_behavior_items) > 1:
+                    behavior_rect_item = self.new_behavior_items[1]
 
                     behavior_rect_item.setRegion((self.behavior_start_time, x))
 
+    @profiled('plot_clicked')
     def plot_clicked(self, event):
         # get x-y coordinates of where the user clicked
         items = self.graph_widget.scene().items(event.scenePos())
@@ -258,14 +571,11 @@ class Window(QMainWindow):
             x = pos.x()
             y = pos.y()
 
-            if 0 <= x <= self.tail_angles[self.selected_tail_angles].shape[0]:
+            if 0 <= x <= self.get_derived_signals(self.selected_tail_angles).n_frames:
                 if self.behavior_start_time is None:
-                    if len(self.behavior_times[self.selected_tail_angles]) > 0:
-                        behavior_clicked = np.any([ a[0] <= x <= a[1] for a in self.behavior_times[self.selected_tail_angles] ])
-                    else:
-                        behavior_clicked = False
+                    annotation = self.annotations[self.selected_tail_angles].at(x)
 
-                    if not behavior_clicked:
+                    if annotation is None:
                         self.selected_behavior = None
 
                         behavior_index = 0
@@ -277,95 +587,53 @@ class Window(QMainWindow):
                         behavior_rect_item = pg.LinearRegionItem(values=[x, x], orientation=pg.LinearRegionItem.Vertical, brush=pg.mkBrush(QColor(colors[behavior_index][0], colors[behavior_index][1], colors[behavior_index][2], 20)), movable=False)
                         self.tail_plot.vb.addItem(behavior_rect_item)
 
-                        behavior_start_line_item.sigPositionChanged.connect(self.behavior_start_time_changed)
                         self.tail_plot.vb.addItem(behavior_start_line_item)
-                        self.behavior_items[self.selected_tail_angles].append([behavior_start_line_item])
-                        self.behavior_items[self.selected_tail_angles][-1].append(behavior_rect_item)
+                        self.new_behavior_items = [behavior_start_line_item, behavior_rect_item]
                     else:
-                        # show the menu position to be under the mouse
-                        position = self.main_widget.mapToGlobal(QPoint(0, 0)) + event.pos() + QPoint(self.video_viewbox.screenGeometry().width(), 0)
-                        self.menu.move(QPoint(position.x(), position.y()))
-
-                        # figure out which behavior was clicked
-                        self.selected_behavior = [ a[0] <= x <= a[1] for a in self.behavior_times[self.selected_tail_angles] ].index(True)
-                        behavior = self.behaviors[self.selected_tail_angles][self.selected_behavior]
-
-                        # get the current identity of the behavior
-                        identity_index = behaviors.index(behavior)
-
-                        # set the menu actions accordingly
-                        actions = self.menu.actions()
-                        for i in range(len(actions)):
-                            if i == identity_index:
-                                actions[i].setChecked(True)
-                            else:
-                                actions[i].setChecked(False)
-
-                        # show the menu
-                        self.menu.show()
+                        self.show_behavior_menu(event, annotation)
                 else:
                     self.behavior_end_time = x
 
                     behavior_index = 0
 
-                    behavior_end_line_item = pg.InfiniteLine(pos=x, angle=90, pen=pg.mkPen(color=colors[behavior_index]), movable=True, hoverPen=pg.mkPen(color=colors[behavior_index], width=3))
-                    behavior_end_line_item.sigPositionChanged.connect(self.behavior_end_time_changed)
-                    self.tail_plot.vb.addItem(behavior_end_line_item)
-                    self.behavior_items[self.selected_tail_angles][-1].append(behavior_end_line_item)
-
-
-                    text_item = pg.TextItem(behaviors[behavior_index], color=colors[behavior_index], anchor=[0.5, 0.5])
-                    y = 0.9*np.nanmax(np.nanmean(self.tail_angles[self.selected_tail_angles][:, -3:], axis=1))
-                    x = (self.behavior_end_time + self.behavior_start_time)/2.0
-                    text_item.setPos(x, y)
-                    self.tail_plot.vb.addItem(text_item)
-                    self.behavior_items[self.selected_tail_angles][-1].append(text_item)
-                    
-                    print("Created text item at position ({}, {}).".format(x, y))
-
                     # flip start and end if end time is before start time
                     if self.behavior_end_time < self.behavior_start_time:
-                        behavior_times = [self.behavior_end_time, self.behavior_start_time]
-                        self.behavior_items[self.selected_tail_angles][-1] = [self.behavior_items[self.selected_tail_angles][-1][2], self.behavior_items[self.selected_tail_angles][-1][1], self.behavior_items[self.selected_tail_angles][-1][0], self.behavior_items[self.selected_tail_angles][-1][3]]
-                        self.behavior_items[self.selected_tail_angles][-1][0].sigPositionChanged.disconnect()
-                        self.behavior_items[self.selected_tail_angles][-1][0].sigPositionChanged.connect(self.behavior_start_time_changed)
-
-                        self.behavior_items[self.selected_tail_angles][-1][2].sigPositionChanged.disconnect()
-                        self.behavior_items[self.selected_tail_angles][-1][2].sigPositionChanged.connect(self.behavior_end_time_changed)
+                        annotation = self.annotations[self.selected_tail_angles].add(behaviors[behavior_index], self.behavior_end_time, self.behavior_start_time)
                     else:
-                        behavior_times = [self.behavior_start_time, self.behavior_end_time]
-
-                    self.behavior_times[self.selected_tail_angles].append(behavior_times)
+                        annotation = self.annotations[self.selected_tail_angles].add(behaviors[behavior_index], self.behavior_start_time, self.behavior_end_time)
 
-                    self.behaviors[self.selected_tail_angles].append(behaviors[behavior_index])
+                    # the new behavior is drawn using items from the pool, like every other behavior
+                    for item in self.new_behavior_items:
+                        self.tail_plot.vb.removeItem(item)
 
                     self.behavior_start_time = None
                     self.behavior_end_time   = None
+                    self.new_behavior_items  = []
 
-                    # show the menu position to be under the mouse
-                    position = self.main_widget.mapToGlobal(QPoint(0, 0)) + event.pos() + QPoint(self.video_viewbox.screenGeometry().width(), 0)
-                    self.menu.move(QPoint(position.x(), position.y()))
+                    self.update_shown_behaviors()
 
-                    # figure out which behavior was clicked
-                    booleans = [ a[0] <= x <= a[1] for a in self.behavior_times[self.selected_tail_angles] ]
+                    self.show_behavior_menu(event, annotation)
 
-                    if True in booleans:
-                        self.selected_behavior = booleans.index(True)
-                        behavior = self.behaviors[self.selected_tail_angles][self.selected_behavior]
+    def show_behavior_menu(self, event, annotation):
+        # show the menu position to be under the mouse
+        position = self.main_widget.mapToGlobal(QPoint(0, 0)) + event.pos() + QPoint(self.video_viewbox.screenGeometry().width(), 0)
+        self.menu.move(QPoint(position.x(), position.y()))
 
-                        # get the current identity of the behavior
-                        identity_index = behaviors.index(behavior)
+        self.selected_behavior = annotation
 
-                        # set the menu actions accordingly
-                        actions = self.menu.actions()
-                        for i in range(len(actions)):
-                            if i == identity_index:
-                                actions[i].setChecked(True)
-                            else:
-                                actions[i].setChecked(False)
+        # get the current identity of the behavior
+        identity_index = behaviors.index(annotation.label)
 
-                        # show the menu
-                        self.menu.show()
+        # set the menu actions accordingly
+        actions = self.menu.actions()
+        for i in range(len(actions)):
+            if i == identity_index:
+                actions[i].setChecked(True)
+            else:
+                actions[i].setChecked(False)
+
+        # show the menu
+        self.menu.show()
 
     def import_tail_angles(self):
         # let user pick tail angle files
@@ -378,52 +646,151 @@ class Window(QMainWindow):
 
         # import the tail angle files
         if tail_angle_paths is not None and len(tail_angle_paths) > 0:
-            for tail_angle_path in tail_angle_paths:
-                try:
-                    tail_angles = np.genfromtxt(tail_angle_path, delimiter=",")[:, 1:]
-                    self.tail_angles.append(tail_angles)
-                    self.tail_angle_paths.append(tail_angle_path)
-                    self.behavior_times.append([])
-                    self.behavior_items.append([])
-                    self.behaviors.append([])
-                    self.video_paths.append(None)
-                    self.videos.append(None)
-
-                    item = QListWidgetItem(tail_angle_path)
-                    item.setFlags(item.flags() & ~Qt.ItemIsDragEnabled)
-                    self.tail_angles_list.addItem(item)
-                except:
-                    print("Error reading file '{}'.".format(tail_angle_path))
+            self.import_tail_angle_paths(tail_angle_paths)
 
+    def import_tail_angles_from_folder(self):
+        directory = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
+
+        if len(directory) > 0:
+            tail_angle_paths = sorted(glob.glob(os.path.join(directory, '*.csv')))
+
+            if len(tail_angle_paths) > 0:
+                self.import_tail_angle_paths(tail_angle_paths)
+
+    def import_tail_angle_paths(self, tail_angle_paths):
+        self.import_queue   = queue.Queue()
+        self.import_results = {} # results that finished before those of earlier files, by index
+        self.import_errors  = []
+        self.import_count   = 0
+        self.import_added   = 0 # number of files whose results were added, in the order they were given
+        self.import_total   = len(tail_angle_paths)
+        self.import_first   = len(self.tail_angle_paths) # index of the first recording of this import
+        self.import_start   = time.time()
+
+        # behaviors of the recordings that are in the database are loaded with them
+        if self.database is not None:
+            self.import_behaviors = self.database.load_recordings(tail_angle_paths)
+        else:
+            self.import_behaviors = {}
+
+        # parse the files in worker processes, which put each result in the queue as soon as it is done
+        self.import_pool = multiprocessing.Pool()
+        for index, tail_angle_path in enumerate(tail_angle_paths):
+            self.import_pool.apply_async(preload_tail_angles, (tail_angle_path,), callback=lambda result, index=index: self.import_queue.put((index, result)))
+        self.import_pool.close()
+
+        # don't allow another import to start until this one is done
+        self.add_tail_angles_button.setDisabled(True)
+        self.add_tail_angles_from_folder_button.setDisabled(True)
+
+        # create progress dialog
+        self.import_progress = QProgressDialog("Importing tail angles...", "Cancel", 0, self.import_total, self)
+        self.import_progress.setWindowTitle("Importing Tail Angles")
+        self.import_progress.setMinimumDuration(0)
+        self.import_progress.canceled.connect(self.cancel_tail_angle_import)
+        self.import_progress.show()
+
+        # check for finished files periodically
+        self.import_timer = QTimer(self)
+        self.import_timer.timeout.connect(self.check_tail_angle_import)
+        self.import_timer.start(50)
+
+    @profiled('import.check')
+    def check_tail_angle_import(self):
+        n_tail_angles = len(self.tail_angles)
+
+        while True:
+            try:
+                index, result = self.import_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self.import_results[index] = result
+            self.import_count += 1
+
+        # files finish in any order, but are added in the order they were given
+        self.add_import_results()
+
+        self.import_progress.setValue(self.import_count)
+
+        # show the first tail angles as soon as they are available
+        if n_tail_angles == 0 and len(self.tail_angles) > 0:
             self.tail_angles_list.setCurrentRow(self.selected_tail_angles)
 
             self.plot_selected_tail_angles()
 
-    def import_tail_angles_from_folder(self):
-        directory = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
+        if self.import_count == self.import_total:
+            self.finish_tail_angle_import()
+
+    def add_import_results(self, skip_missing=False):
+        while self.import_added < self.import_total:
+            result = self.import_results.pop(self.import_added, None)
 
-        tail_angle_paths = glob.glob(os.path.join(directory, '*.csv'))
+            if result is not None:
+                tail_angle_path, tail_angles, error = result
+
+                # files that the worker wrote to the cache are only loaded once they are selected
+                if error is None:
+                    self.add_tail_angles(tail_angle_path, tail_angles, self.import_behaviors.get(tail_angle_path, ()))
+                else:
+                    self.import_errors.append((tail_angle_path, error))
+            elif not skip_missing:
+                break
 
-        for tail_angle_path in tail_angle_paths:
+            self.import_added += 1
+
+    def cancel_tail_angle_import(self):
+        # files that were already imported are kept, in order
+        self.import_pool.terminate()
+
+        while True:
             try:
-                tail_angles = np.genfromtxt(tail_angle_path, delimiter=",")[:, 1:]
-                self.tail_angles.append(tail_angles)
-                self.tail_angle_paths.append(tail_angle_path)
-                self.behavior_times.append([])
-                self.behavior_items.append([])
-                self.behaviors.append([])
-                self.video_paths.append(None)
-                self.videos.append(None)
-
-                item = QListWidgetItem(tail_angle_path)
-                item.setFlags(item.flags() & ~Qt.ItemIsDragEnabled)
-                self.tail_angles_list.addItem(item)
-            except:
-                print("Error reading file '{}'.".format(tail_angle_path))
+                index, result = self.import_queue.get_nowait()
+            except queue.Empty:
+                break
 
-            self.tail_angles_list.setCurrentRow(self.selected_tail_angles)
+            self.import_results[index] = result
+
+        self.add_import_results(skip_missing=True)
+
+        self.finish_tail_angle_import()
+
+    def finish_tail_angle_import(self):
+        self.import_timer.stop()
+        self.import_pool.join()
+
+        profiler.record('import', time.time() - self.import_start, self.import_start)
+
+        self.import_progress.canceled.disconnect()
+        self.import_progress.hide()
+
+        self.add_tail_angles_button.setDisabled(False)
+        self.add_tail_angles_from_folder_button.setDisabled(False)
+
+        # recordings that didn't get behaviors from the database may have been autosaved before a crash
+        self.restore_autosaves([ i for i in range(self.import_first, len(self.tail_angle_paths)) if len(self.annotations[i]) == 0 ], 0)
 
-        self.plot_selected_tail_angles()
+        # report files that could not be read
+        if len(self.import_errors) > 0:
+            for tail_angle_path, error in self.import_errors:
+                print("Error reading file '{}': {}".format(tail_angle_path, error))
+
+            message_box = QMessageBox(QMessageBox.Warning, "Error Importing Tail Angles", "{} of {} files could not be read.".format(len(self.import_errors), self.import_total), QMessageBox.Ok, self)
+            message_box.setDetailedText("\n".join([ "{}: {}".format(tail_angle_path, error) for tail_angle_path, error in self.import_errors ]))
+            message_box.exec_()
+
+    def add_tail_angles(self, tail_angle_path, tail_angles=None, annotations=(), cache=None):
+        self.tail_angles.append(tail_angle_path, tail_angles, cache)
+        self.derived_signals.append(None)
+        self.feature_tables.append(None)
+        self.tail_angle_paths.append(tail_angle_path)
+        self.annotations.append(AnnotationStore(on_change=self.autosave_timer.start, annotations=annotations))
+        self.video_paths.append(None)
+        self.videos.append(None)
+
+        item = QListWidgetItem(tail_angle_path)
+        item.setFlags(item.flags() & ~Qt.ItemIsDragEnabled)
+        self.tail_angles_list.addItem(item)
 
     def import_video(self):
         # let user pick a video file
@@ -439,15 +806,9 @@ class Window(QMainWindow):
             video_path = video_paths[0]
 
             self.video_paths[self.selected_tail_angles] = video_path
-            capture = cv2.VideoCapture(video_path)
-
-            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            _, frame = capture.read()
-            frame = frame.transpose((1, 0, 2))
+            self.videos[self.selected_tail_angles]      = video_path
 
-            self.videos[self.selected_tail_angles] = capture
-
-            self.video_plot.setImage(frame)
+            self.show_first_frame()
 
     def import_videos_from_folder(self):
         directory = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
@@ -466,94 +827,635 @@ class Window(QMainWindow):
 
                 if os.path.exists(video_path):
                     self.video_paths[i] = video_path
-                    capture = cv2.VideoCapture(video_path)
-
-                    self.videos[i] = capture
+                    self.videos[i]      = video_path
 
                     if i == self.selected_tail_angles:
-                        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        _, frame = capture.read()
-                        frame = frame.transpose((1, 0, 2))
+                        self.show_first_frame()
+
+    @profiled('show_first_frame')
+    def show_first_frame(self):
+        frame = self.videos[self.selected_tail_angles].get_frame(0)
+
+        if frame is not None:
+            self.show_frame(frame)
+
+        self.current_frame   = 0
+        self.requested_frame = 0
+        self.proxy_frame     = None
+
+    def show_requested_frame(self):
+        waiting = self.show_grid_frames()
+
+        if len(self.videos) == 0 or self.videos[self.selected_tail_angles] is None or self.requested_frame == self.current_frame:
+            if not waiting:
+                self.frame_timer.stop()
+        else:
+            video = self.videos[self.selected_tail_angles]
+            frame = video.cached_frame(self.requested_frame)
+
+            if frame is not None:
+                self.show_frame(frame)
+
+                self.current_frame = self.requested_frame
+                self.proxy_frame   = None
+
+                profiler.record('frame_fetch', time.time() - self.request_time)
+            elif video.frame_failed(self.requested_frame):
+                # stop waiting for a frame that will never be decoded
+                print("Couldn't read frame {} of '{}'.".format(self.requested_frame, video.video_path))
+
+                self.current_frame = self.requested_frame
+
+                if not waiting:
+                    self.frame_timer.stop()
+            elif self.requested_frame != self.proxy_frame:
+                frame = video.proxy_frame(self.requested_frame)
+
+                if frame is not None:
+                    self.show_frame(frame)
+
+                    self.proxy_frame = self.requested_frame
+
+                    profiler.record('frame_fetch.proxy', time.time() - self.request_time)
+
+    def request_full_frame(self):
+        if len(self.videos) > 0 and self.videos[self.selected_tail_angles] is not None:
+            self.videos[self.selected_tail_angles].request_frame(self.requested_frame)
+
+            if not self.frame_timer.isActive():
+                self.frame_timer.start()
+
+        for pane in self.grid_panes:
+            video = self.grid_pane_video(pane)
+
+            if video is not None and video.proxy is not None:
+                video.request_frame(pane.requested_frame)
+
+                if not self.frame_timer.isActive():
+                    self.frame_timer.start()
+
+    @profiled('show_frame')
+    def show_frame(self, frame):
+        # proxy frames are smaller than the video, so they are scaled up to the size of the video
+        video = self.videos[self.selected_tail_angles]
+
+        self.video_plot.setImage(frame)
+
+        self.frames_shown += 1
+
+        # the width is unknown if the video couldn't be opened
+        if video.width > 0:
+            self.video_plot.setScale(float(video.width)/frame.shape[0])
+
+    def play_toggled(self, checked):
+        if checked:
+            self.start_playback()
+        else:
+            self.stop_playback()
+
+    def playback_speed_changed(self):
+        # continue playing from the current frame at the new speed
+        if self.playback is not None:
+            self.stop_playback()
+            self.play_button.setChecked(True)
+
+    def start_playback(self):
+        if len(self.videos) == 0 or self.videos[self.selected_tail_angles] is None:
+            self.play_button.setChecked(False)
+            return
+
+        video    = self.videos[self.selected_tail_angles]
+        n_frames = self.get_derived_signals(self.selected_tail_angles).n_frames
+        if video.n_frames > 0:
+            n_frames = min(n_frames, video.n_frames)
+
+        # start over once the end was reached
+        start_frame = self.current_frame if self.current_frame < n_frames - 1 else 0
+
+        speed = playback_speeds[self.playback_speed_box.currentIndex()]
+
+        self.playback = Playback(video.video_path, start_frame, n_frames, speed, framerate, self.refresh_rate,
+                                 seek_index=video.seek_index, buffer_size=playback_buffer_size)
+        self.playback.start()
+
+        # the videos of grid mode are played in step with the selected one, each decoded on its own thread
+        for pane in self.grid_panes:
+            pane_video = self.grid_pane_video(pane)
+
+            if pane_video is not None:
+                pane_n_frames = pane.n_frames if pane_video.n_frames == 0 else min(pane.n_frames, pane_video.n_frames)
+
+                if start_frame < pane_n_frames:
+                    pane.playback = Playback(pane_video.video_path, start_frame, pane_n_frames, speed, framerate, self.refresh_rate,
+                                             seek_index=pane_video.seek_index, buffer_size=playback_buffer_size)
+                    pane.playback.start(self.playback.start_time)
+
+        self.frame_timer.stop()
+        self.rest_timer.stop()
+
+        self.playback_timer.setInterval(max(1, int(500*self.playback.interval)))
+        self.playback_timer.start()
+
+        self.play_button.setText('Pause')
+
+    def stop_playback(self):
+        if self.playback is None:
+            return
+
+        playback      = self.playback
+        self.playback = None
+
+        self.playback_timer.stop()
+        playback.stop()
+
+        for pane in self.grid_panes:
+            if pane.playback is not None:
+                pane.playback.stop()
+                pane.playback = None
+
+                pane.requested_frame = pane.current_frame
+
+        print("Played {} frames and dropped {}.".format(playback.n_shown, playback.n_dropped))
+
+        self.requested_frame = self.current_frame
+
+        self.play_button.setText('Play')
+        self.play_button.setChecked(False)
+
+    @profiled('show_playback_frame')
+    def show_playback_frame(self):
+        if self.playback.done():
+            self.stop_playback()
+            return
+
+        for pane in self.grid_panes:
+            if pane.playback is not None:
+                result = pane.playback.take_frame()
+
+                if result is not None:
+                    self.show_grid_frame(pane, result[1])
+
+                    pane.current_frame   = result[0]
+                    pane.requested_frame = result[0]
+                    pane.line.setValue(result[0]/float(framerate))
+
+        result = self.playback.take_frame()
+        if result is None:
+            return
+
+        frame_num, frame = result
+
+        self.show_frame(frame)
+
+        self.current_frame   = frame_num
+        self.requested_frame = frame_num
+        self.proxy_frame     = None
+
+        # move the cursor, and scroll the plot when it leaves the view
+        x = frame_num/float(framerate)
+
+        if self.preview_line_item is None:
+            self.preview_line_item = pg.InfiniteLine(pos=x, angle=90, pen=pg.mkPen((0, 0, 0, 100)))
+            self.tail_plot.vb.addItem(self.preview_line_item)
+        else:
+            self.preview_line_item.setValue(x)
+
+        x_min, x_max = self.tail_plot.vb.viewRange()[0]
+        if not x_min <= x <= x_max:
+            self.tail_plot.vb.setXRange(x, x + x_max - x_min, padding=0)
+
+    def grid_toggled(self, checked):
+        # in grid mode, several recordings can be selected
+        if checked:
+            self.tail_angles_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        else:
+            self.tail_angles_list.setSelectionMode(QAbstractItemView.SingleSelection)
+
+            if len(self.tail_angle_paths) > 0:
+                self.tail_angles_list.clearSelection()
+                self.tail_angles_list.setCurrentItem(self.tail_angles_list.findItems(self.tail_angle_paths[self.selected_tail_angles], Qt.MatchExactly)[0])
+
+        self.update_grid()
 
-                        self.video_plot.setImage(frame)
+    @profiled('update_grid')
+    def update_grid(self):
+        # show the selected recordings other than the selected one below it, in the order of the list
+        tail_angle_paths = []
 
+        if self.grid_checkbox.isChecked() and self.deferred_widgets_created:
+            items = sorted(self.tail_angles_list.selectedItems(), key=self.tail_angles_list.row)
+
+            tail_angle_paths = [ item.text() for item in items if self.tail_angle_paths.index(item.text()) != self.selected_tail_angles ][:max_grid_panes]
+
+        if tail_angle_paths == [ pane.tail_angle_path for pane in self.grid_panes ]:
+            return
+
+        self.stop_playback()
+        self.clear_grid()
+
+        for row, tail_angle_path in enumerate(tail_angle_paths):
+            self.grid_panes.append(self.create_grid_pane(row + 1, self.tail_angle_paths.index(tail_angle_path)))
+
+        # show the frame at the cursor in every new pane
+        self.request_grid_frames(self.current_frame)
+
+    def create_grid_pane(self, row, index):
+        signals = self.get_derived_signals(index)
+        pane    = GridPane(self.tail_angle_paths[index], signals.n_frames)
+
+        pane.viewbox = self.graph_widget.addViewBox(lockAspect=True, border=None, row=row, col=0, invertY=True)
+        pane.image   = pg.ImageItem()
+        pane.viewbox.addItem(pane.image)
+
+        pane.plot = self.graph_widget.addPlot(row=row, col=1)
+        pane.plot.setTitle(os.path.basename(self.tail_angle_paths[index]), size='8pt')
+        pane.plot.setMouseEnabled(x=True, y=False)
+        pane.plot.setXLink(self.tail_plot)
+        pane.plot.vb.setRange(yRange=(signals.min_tip_angle, signals.max_tip_angle))
+        pane.plot.vb.disableAutoRange()
+
+        pane.pyramid = signals.pyramid
+        pane.curve   = pane.plot.plot(pen=pg.mkPen((255, 0, 0, 255), width=2))
+        pane.plot.vb.sigResized.connect(lambda *args: self.draw_tail_curve(pane.curve, pane.pyramid, pane.plot.vb))
+
+        pane.line = pg.InfiniteLine(pos=self.current_frame/float(framerate), angle=90, pen=pg.mkPen((0, 0, 0, 100)))
+        pane.plot.vb.addItem(pane.line)
+
+        self.draw_tail_curve(pane.curve, pane.pyramid, pane.plot.vb)
+
+        return pane
+
+    def clear_grid(self):
+        for pane in self.grid_panes:
+            if pane.playback is not None:
+                pane.playback.stop()
+
+            self.graph_widget.removeItem(pane.viewbox)
+            self.graph_widget.removeItem(pane.plot)
+
+        self.grid_panes = []
+
+    def grid_pane_video(self, pane):
+        return self.videos[self.tail_angle_paths.index(pane.tail_angle_path)]
+
+    def request_grid_frames(self, frame_num):
+        # have the videos of grid mode decode a frame. each video is decoded by its own thread, so the frames
+        # are decoded in parallel, and they are shown by the frame timer
+        for pane in self.grid_panes:
+            video = self.grid_pane_video(pane)
+
+            if video is None or not 0 <= frame_num < pane.n_frames:
+                continue
+
+            # the video may be shorter than the tail angles, in which case its last frame is shown
+            pane_frame_num = min(frame_num, video.n_frames - 1) if video.n_frames > 0 else frame_num
+
+            if pane_frame_num == pane.requested_frame:
+                continue
+
+            pane.requested_frame = pane_frame_num
+
+            if video.proxy is not None:
+                self.rest_timer.start()
+            else:
+                video.request_frame(pane_frame_num)
+
+            if not self.frame_timer.isActive():
+                self.frame_timer.start()
+
+    def show_grid_frames(self):
+        # show the frames of grid mode that have been decoded, returning whether any are still being waited for
+        waiting = False
+
+        for pane in self.grid_panes:
+            video = self.grid_pane_video(pane)
+
+            if video is None or pane.requested_frame == pane.current_frame:
+                continue
+
+            frame = video.cached_frame(pane.requested_frame)
+
+            if frame is not None:
+                self.show_grid_frame(pane, frame)
+
+                pane.current_frame = pane.requested_frame
+                pane.proxy_frame   = None
+            elif video.frame_failed(pane.requested_frame):
+                # stop waiting for a frame that will never be decoded
+                pane.current_frame = pane.requested_frame
+            else:
+                if pane.requested_frame != pane.proxy_frame:
+                    frame = video.proxy_frame(pane.requested_frame)
+
+                    if frame is not None:
+                        self.show_grid_frame(pane, frame)
+
+                        pane.proxy_frame = pane.requested_frame
+
+                waiting = True
+
+        return waiting
+
+    def show_grid_frame(self, pane, frame):
+        video = self.grid_pane_video(pane)
+
+        pane.image.setImage(frame)
+
+        if video.width > 0:
+            pane.image.setScale(float(video.width)/frame.shape[0])
+
+    @profiled('plot_selected_tail_angles')
     def plot_selected_tail_angles(self):
-        self.plot_tail_angles(self.tail_angles[self.selected_tail_angles])
+        self.plot_tail_angles(self.get_derived_signals(self.selected_tail_angles))
 
-    def behavior_start_time_changed(self, item):
-        # get index of the behavior
-        behavior_start_line_items = [ a[0] for a in self.behavior_items[self.selected_tail_angles] ]
-        index = behavior_start_line_items.index(item)
-        
-        # update behavior start time
-        self.behavior_times[self.selected_tail_angles][index][0] = item.value()
+    def get_derived_signals(self, index):
+        # derived signals are computed the first time they are needed, and kept until the recording is removed
+        if self.derived_signals[index] is None:
+            self.derived_signals[index] = load_derived_signals(self.tail_angle_paths[index], lambda: self.tail_angles[index])
 
-        behavior_rect_items = [ a[1] for a in self.behavior_items[self.selected_tail_angles] ]
-        behavior_rect_item = behavior_rect_items[index]
-        
-        behavior_start_times = [ a[0] for a in self.behavior_times[self.selected_tail_angles] ]
-        behavior_start_time = behavior_start_times[index]
+        return self.derived_signals[index]
 
-        behavior_end_times = [ a[1] for a in self.behavior_times[self.selected_tail_angles] ]
-        behavior_end_time = behavior_end_times[index]
+    def get_bout_features(self, index):
+        # return the behaviors of a recording and the features of their bouts. features are only computed for
+        # behaviors that were added or moved since the last time
+        if self.feature_tables[index] is None:
+            tail_angle_path = self.tail_angle_paths[index]
 
-        text_items = [ a[3] for a in self.behavior_items[self.selected_tail_angles] ]
-        text_item = text_items[index]
-        y = 0.9*np.nanmax(np.nanmean(self.tail_angles[self.selected_tail_angles][:, -3:], axis=1))
-        x = (behavior_end_time + behavior_start_time)/2.0
-        text_item.setPos(x, y)
+            # the recording's index changes if earlier recordings are removed
+            self.feature_tables[index] = BoutFeatureTable(self.get_derived_signals(index).tip_angles, lambda: self.tail_angles[self.tail_angle_paths.index(tail_angle_path)], framerate)
+
+        annotations  = list(self.annotations[index])
+        starts, ends = annotation_frames(annotations, framerate)
+
+        return annotations, self.feature_tables[index].update(starts, ends)
+
+    @profiled('drag')
+    def behavior_start_time_changed(self, item):
+        # update behavior start time
+        annotation = self.annotations[self.selected_tail_angles].annotation_for_item(item)
 
-        behavior_rect_item.setRegion((behavior_start_time, behavior_end_time))
+        if annotation is not None:
+            self.annotations[self.selected_tail_angles].move(annotation, start_time=item.value())
 
+            self.accept_behavior(annotation)
+            self.update_behavior_items(annotation)
+
+    @profiled('drag')
     def behavior_end_time_changed(self, item):
-        # get index of the behavior
-        behavior_end_line_items = [ a[2] for a in self.behavior_items[self.selected_tail_angles] ]
-        index = behavior_end_line_items.index(item)
-        
         # update behavior end time
-        self.behavior_times[self.selected_tail_angles][index][1] = item.value()
+        annotation = self.annotations[self.selected_tail_angles].annotation_for_item(item)
 
-        behavior_rect_items = [ a[1] for a in self.behavior_items[self.selected_tail_angles] ]
-        behavior_rect_item = behavior_rect_items[index]
-        
-        behavior_start_times = [ a[0] for a in self.behavior_times[self.selected_tail_angles] ]
-        behavior_start_time = behavior_start_times[index]
+        if annotation is not None:
+            self.annotations[self.selected_tail_angles].move(annotation, end_time=item.value())
+
+            self.accept_behavior(annotation)
+            self.update_behavior_items(annotation)
+
+    def accept_behavior(self, annotation):
+        # editing a proposed behavior accepts it
+        if annotation.proposed:
+            self.annotations[self.selected_tail_angles].accept(annotation)
+
+            self.style_behavior_items(annotation.items, annotation)
+
+    def detection_parameters(self):
+        return { name: box.value() for name, box in self.detection_boxes.items() }
+
+    def detection_parameters_changed(self):
+        # detect the bouts again if the selected tail angles still have proposed behaviors
+        if len(self.annotations) > 0 and any([ annotation.proposed for annotation in self.annotations[self.selected_tail_angles] ]):
+            self.detect_bouts()
+
+    @profiled('detect_bouts')
+    def detect_bouts(self):
+        if len(self.annotations) == 0:
+            return
+
+        start_time = time.time()
+
+        store   = self.annotations[self.selected_tail_angles]
+        signals = self.get_derived_signals(self.selected_tail_angles)
+
+        # remove the behaviors proposed by the last detection that haven't been edited
+        proposed = [ annotation for annotation in store if annotation.proposed ]
+
+        for annotation in proposed:
+            if annotation in self.shown_annotations:
+                self.hide_behavior(annotation)
+
+        if self.selected_behavior in proposed:
+            self.selected_behavior = None
+
+        store.delete_all(proposed)
+
+        # propose the bouts that don't overlap behaviors that were already annotated
+        n_bouts = 0
+        for label, bout_start_time, bout_end_time in segment_bouts(signals.tip_angles, framerate, **self.detection_parameters()):
+            if len(store.in_range(bout_start_time, bout_end_time)) == 0:
+                store.add(label, bout_start_time, bout_end_time, proposed=True)
+                n_bouts += 1
+
+        self.update_shown_behaviors()
+
+        print("Detected {} bouts in {:.3f} s.".format(n_bouts, time.time() - start_time))
+
+        self.auto_label_if_enabled()
+
+    def auto_label_if_enabled(self):
+        if self.auto_label_checkbox.isChecked():
+            self.auto_label()
+
+    def auto_label_checked(self):
+        if self.auto_label_checkbox.isChecked() and not self.auto_label():
+            QMessageBox.information(self, "Too Few Examples", "Proposed behaviors are labeled once every behavior has at least {} labeled examples. More examples are needed of: {}.".format(
+                                    self.labeler.min_examples, ", ".join(self.labeler.missing_examples())))
+
+    @profiled('auto_label')
+    def auto_label(self):
+        # label the proposed behaviors of every recording like the most similar behaviors that were labeled by hand.
+        # returns False if there are too few labeled behaviors to do so
+        start_time = time.time()
+
+        example_keys      = []
+        example_features  = []
+        example_labels    = []
+        proposed          = []
+        proposed_features = []
+
+        for i in range(len(self.annotations)):
+            if len(self.annotations[i]) == 0:
+                continue
+
+            annotations, _ = self.get_bout_features(i)
+            rows           = self.feature_tables[i].rows()
+
+            for annotation, row in zip(annotations, rows):
+                if annotation.proposed:
+                    proposed.append((self.annotations[i], annotation))
+                    proposed_features.append(row)
+                else:
+                    example_keys.append((self.tail_angle_paths[i], annotation.label, annotation.start_time, annotation.end_time))
+                    example_features.append(row)
+                    example_labels.append(annotation.label)
+
+        # only behaviors that were labeled since the last time are added to the examples
+        self.labeler.update(example_keys, example_features, example_labels)
+
+        missing = self.labeler.missing_examples()
+        if len(missing) > 0:
+            print("Not auto-labeling until there are at least {} labeled examples of: {}.".format(self.labeler.min_examples, ", ".join(missing)))
+            return False
+
+        if len(proposed) == 0:
+            return True
+
+        labels, confidence = self.labeler.predict(proposed_features)
+
+        for (store, annotation), label, label_confidence in zip(proposed, labels, confidence):
+            store.relabel(annotation, label)
+            annotation.confidence = label_confidence
+
+            if len(annotation.items) > 0:
+                self.style_behavior_items(annotation.items, annotation)
+
+        print("Labeled {} bouts from {} examples in {:.3f} s.".format(len(proposed), len(self.labeler), time.time() - start_time))
+
+        return True
+
+    @profiled('update_shown_behaviors')
+    def update_shown_behaviors(self):
+        if len(self.annotations) == 0:
+            return
+
+        # find behaviors in view, or within half a view of it so that panning doesn't constantly swap items
+        x_min, x_max = self.tail_plot.vb.viewRange()[0]
+        margin       = (x_max - x_min)/2.0
+        annotations  = self.annotations[self.selected_tail_angles].in_range(x_min - margin, x_max + margin)
+
+        # when zoomed out too far, only draw an evenly spread subset of the behaviors
+        if len(annotations) > max_shown_behaviors:
+            annotations = annotations[::int(np.ceil(len(annotations)/float(max_shown_behaviors)))]
+
+        annotations = set(annotations)
+
+        # the selected behavior keeps its items, since the menu may still be open for it
+        if self.selected_behavior in self.shown_annotations:
+            annotations.add(self.selected_behavior)
+
+        for annotation in self.shown_annotations - annotations:
+            self.hide_behavior(annotation)
+
+        for annotation in annotations - self.shown_annotations:
+            self.show_behavior(annotation)
+
+    def show_behavior(self, annotation):
+        if len(self.behavior_item_pool) > 0:
+            items = self.behavior_item_pool.pop()
+        else:
+            items = self.create_behavior_items()
+
+        behavior_start_line_item, behavior_rect_item, behavior_end_line_item, text_item = items
+
+        # set positions before the items are linked to the behavior, so that moving them doesn't move the behavior
+        behavior_start_line_item.setValue(annotation.start_time)
+        behavior_end_line_item.setValue(annotation.end_time)
+
+        self.style_behavior_items(items, annotation)
+
+        self.annotations[self.selected_tail_angles].set_items(annotation, items)
+        self.update_behavior_items(annotation)
+
+        for item in items:
+            item.setVisible(True)
+
+        self.shown_annotations.add(annotation)
+
+    def hide_behavior(self, annotation):
+        for item in annotation.items:
+            item.setVisible(False)
+
+        self.behavior_item_pool.append(annotation.items)
+
+        self.annotations[self.selected_tail_angles].set_items(annotation, [])
+
+        self.shown_annotations.discard(annotation)
+
+    def create_behavior_items(self):
+        behavior_start_line_item = pg.InfiniteLine(angle=90, movable=True)
+        behavior_rect_item       = pg.LinearRegionItem(orientation=pg.LinearRegionItem.Vertical, movable=False)
+        behavior_end_line_item   = pg.InfiniteLine(angle=90, movable=True)
+        text_item                = pg.TextItem(anchor=[0.5, 0.5])
+
+        behavior_start_line_item.sigPositionChanged.connect(self.behavior_start_time_changed)
+        behavior_end_line_item.sigPositionChanged.connect(self.behavior_end_time_changed)
+
+        items = [behavior_start_line_item, behavior_rect_item, behavior_end_line_item, text_item]
 
-        behavior_end_times = [ a[1] for a in self.behavior_times[self.selected_tail_angles] ]
-        behavior_end_time = behavior_end_times[index]
+        for item in items:
+            self.tail_plot.vb.addItem(item)
 
-        text_items = [ a[3] for a in self.behavior_items[self.selected_tail_angles] ]
-        text_item = text_items[index]
-        y = 0.9*np.nanmax(np.nanmean(self.tail_angles[self.selected_tail_angles][:, -3:], axis=1))
-        x = (behavior_end_time + behavior_start_time)/2.0
+        return items
+
+    def style_behavior_items(self, items, annotation):
+        color = colors[behaviors.index(annotation.label)]
+
+        # proposed behaviors are drawn with dashed lines until they are edited or confirmed
+        if annotation.proposed:
+            style = Qt.DashLine
+        else:
+            style = Qt.SolidLine
+
+        if len(items) > 0:
+            items[0].setPen(pg.mkPen(color=color, style=style))
+            items[0].setHoverPen(pg.mkPen(color=color, width=3, style=style))
+        if len(items) > 1:
+            items[1].setBrush(pg.mkBrush(QColor(color[0], color[1], color[2], 20)))
+            items[1].update()
+        if len(items) > 2:
+            items[2].setPen(pg.mkPen(color=color, style=style))
+            items[2].setHoverPen(pg.mkPen(color=color, width=3, style=style))
+        if len(items) > 3:
+            items[3].setColor(color)
+            if annotation.confidence is not None:
+                items[3].setText("{} ({:.0f}%)".format(annotation.label, 100*annotation.confidence))
+            else:
+                items[3].setText(annotation.label)
+
+    def update_behavior_items(self, annotation):
+        behavior_rect_item = annotation.items[1]
+        text_item          = annotation.items[3]
+
+        y = 0.9*self.get_derived_signals(self.selected_tail_angles).max_tip_angle
+        x = (annotation.end_time + annotation.start_time)/2.0
         text_item.setPos(x, y)
 
-        behavior_rect_item.setRegion((behavior_start_time, behavior_end_time))
+        behavior_rect_item.setRegion((annotation.start_time, annotation.end_time))
 
+    @profiled('item_selected')
     def item_selected(self, force_update=False):
         selected_items = self.tail_angles_list.selectedItems()
 
         if len(selected_items) > 0:
+            # in grid mode, the selected recording stays selected while others are added to the grid
+            selected_indices = [ self.tail_angle_paths.index(item.text()) for item in selected_items ]
 
-            index = self.tail_angle_paths.index(selected_items[0].text())
+            if self.selected_tail_angles in selected_indices:
+                index = self.selected_tail_angles
+            else:
+                index = selected_indices[0]
 
             if index != self.selected_tail_angles or force_update:
+                self.stop_playback()
                 self.clear_plot_items()
 
-                self.selected_tail_angles = self.tail_angle_paths.index(selected_items[0].text())
+                self.selected_tail_angles = index
 
                 self.plot_selected_tail_angles()
 
                 self.create_plot_items()
 
                 if self.videos[index] is not None:
-                    capture = self.videos[index]
-
-                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    _, frame = capture.read()
-                    frame = frame.transpose((1, 0, 2))
-
-                    self.video_plot.setImage(frame)
+                    self.show_first_frame()
 
             self.remove_tail_angles_button.setDisabled(False)
             self.add_video_button.setDisabled(False)
@@ -561,23 +1463,29 @@ class Window(QMainWindow):
             self.remove_tail_angles_button.setDisabled(True)
             self.add_video_button.setDisabled(True)
 
+        self.update_grid()
+
     def delete_selected_tail_angles(self):
+        self.stop_playback()
+        self.clear_grid()
         self.clear_plot_items()
 
+        tail_angle_path = self.tail_angle_paths[self.selected_tail_angles]
+
         print(self.selected_tail_angles)
 
         del self.tail_angles[self.selected_tail_angles]
         del self.tail_angle_paths[self.selected_tail_angles]
-        del self.behavior_times[self.selected_tail_angles]
-        del self.behavior_items[self.selected_tail_angles]
-        del self.behaviors[self.selected_tail_angles]
+        del self.derived_signals[self.selected_tail_angles]
+        del self.feature_tables[self.selected_tail_angles]
+        del self.annotations[self.selected_tail_angles]
         del self.video_paths[self.selected_tail_angles]
         del self.videos[self.selected_tail_angles]
 
         if self.selected_tail_angles >= len(self.tail_angles):
             self.selected_tail_angles -= 1
 
-        selected_items = self.tail_angles_list.selectedItems()
+        selected_items = [ item for item in self.tail_angles_list.selectedItems() if item.text() == tail_angle_path ]
         self.tail_angles_list.takeItem(self.tail_angles_list.row(selected_items[0]))
 
         # print(self.tail_angle_paths)
@@ -591,71 +1499,374 @@ class Window(QMainWindow):
     def delete_selected_behavior(self):
         print("Deleting behavior")
         if self.selected_behavior is not None:
-            for item in self.behavior_items[self.selected_tail_angles][self.selected_behavior]:
-                self.tail_plot.vb.removeItem(item)
+            if self.selected_behavior in self.shown_annotations:
+                self.hide_behavior(self.selected_behavior)
 
-            del self.behavior_times[self.selected_tail_angles][self.selected_behavior]
-            del self.behavior_items[self.selected_tail_angles][self.selected_behavior]
-            del self.behaviors[self.selected_tail_angles][self.selected_behavior]
+            self.annotations[self.selected_tail_angles].delete(self.selected_behavior)
 
             self.selected_behavior = None
 
+            self.update_shown_behaviors()
+
+    @profiled('clear_plot_items')
     def clear_plot_items(self):
-        for item_list in self.behavior_items[self.selected_tail_angles]:
-            for i in range(len(item_list)):
-                item = item_list[i]
-                # item_2 = item
-                self.tail_plot.vb.removeItem(item)
-                # item_list[i] = item
+        for annotation in list(self.shown_annotations):
+            self.hide_behavior(annotation)
+
+        self.selected_behavior = None
 
+        # cancel a behavior that is being created
+        for item in self.new_behavior_items:
+            self.tail_plot.vb.removeItem(item)
+
+        self.new_behavior_items  = []
+        self.behavior_start_time = None
+
+    @profiled('create_plot_items')
     def create_plot_items(self):
-        for item_list in self.behavior_items[self.selected_tail_angles]:
-            for item in item_list:
-                self.tail_plot.vb.addItem(item)
+        self.update_shown_behaviors()
 
     def action_chosen(self, action):
         actions = self.menu.actions()
         index = actions.index(action)
 
         if index < len(actions)-1:
-            self.behaviors[self.selected_tail_angles][self.selected_behavior] = behaviors[index]
-
-            items = self.behavior_items[self.selected_tail_angles][self.selected_behavior]
-
-            if len(items) > 0:
-                items[0].setPen(pg.mkPen(color=colors[index]))
-                items[0].setHoverPen(pg.mkPen(color=colors[index], width=3))
-            if len(items) > 1:
-                items[1].setBrush(pg.mkBrush(QColor(colors[index][0], colors[index][1], colors[index][2], 20)))
-                items[1].update()
-            if len(items) > 2:
-                items[2].setPen(pg.mkPen(color=colors[index]))
-                items[2].setHoverPen(pg.mkPen(color=colors[index], width=3))
-            if len(items) > 3:
-                items[3].setColor(colors[index])
-                items[3].setText(behaviors[index])
+            # choosing a label for a proposed behavior confirms it
+            self.annotations[self.selected_tail_angles].relabel(self.selected_behavior, behaviors[index])
+            self.annotations[self.selected_tail_angles].accept(self.selected_behavior)
+
+            self.style_behavior_items(self.selected_behavior.items, self.selected_behavior)
+
+            self.auto_label_if_enabled()
         else:
             self.delete_selected_behavior()
 
+    @profiled('save_results')
     def save_results(self):
         directory = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
 
+        if directory == "":
+            return
+
+        # from now on, changes are saved to this directory
+        self.results_directory = directory
+
+        self.wait_for_autosave()
+
+        # only files of recordings that changed since they were last saved to this directory are written
+        n_saved = 0
         for i in range(len(self.tail_angles)):
-            tail_angle_path = self.tail_angle_paths[i]
+            version = self.annotations[i].version
+            saved   = False
 
-            base_name = os.path.basename(tail_angle_path)
-            name      = os.path.splitext(base_name)[0]
+            # recordings that never had behaviors have nothing to save
+            if len(self.annotations[i]) == 0 and version == 0:
+                continue
 
-            if tail_angle_path.endswith("_tail_angles.csv"):
-                video_name = name.split("_tail_angles")[0]
+            path = behaviors_path(directory, self.tail_angle_paths[i])
+            if self.saved_versions.get(path) != version:
+                save_behaviors(path, self.annotations[i])
+
+                self.saved_versions[path] = version
+                saved = True
+
+            # the autosave of the recording is no longer needed to recover its behaviors
+            if os.path.exists(self.autosave_path(self.tail_angle_paths[i])):
+                try:
+                    os.remove(self.autosave_path(self.tail_angle_paths[i]))
+                except OSError:
+                    pass
+
+            # save the features of the bouts for analysis, if wanted. computing them needs the tail angles
+            path = features_path(directory, self.tail_angle_paths[i])
+            if self.save_features_checkbox.isChecked() and self.saved_versions.get(path) != version:
+                if len(self.annotations[i]) > 0:
+                    annotations, columns = self.get_bout_features(i)
+                else:
+                    annotations, columns = [], {}
+
+                save_features(path, annotations, columns)
+
+                self.saved_versions[path] = version
+                saved = True
+
+            n_saved += saved
+
+        print("Saved {} of {} recordings to '{}'.".format(n_saved, len(self.tail_angles), directory))
+
+        # save the recordings that changed since they were last saved to the database, in one transaction
+        if self.database is not None:
+            recordings = [ (self.tail_angle_paths[i], self.annotations[i].version, self.annotations[i]) for i in range(len(self.tail_angles))
+                           if self.saved_versions.get((self.database.path, self.tail_angle_paths[i])) != self.annotations[i].version ]
+
+            self.write_database(recordings)
+
+    def save_project(self):
+        # let user pick where to save the project
+        if pyqt_version == 4:
+            project_path = str(QFileDialog.getSaveFileName(self, 'Save project.', '', 'Project Files (*.json)'))
+        elif pyqt_version == 5:
+            project_path = str(QFileDialog.getSaveFileName(self, 'Save project.', '', 'Project Files (*.json)')[0])
+
+        if project_path == "":
+            return
+
+        view = {
+            'selected':             self.selected_tail_angles,
+            'x_range':              [ float(x) for x in self.tail_plot.vb.viewRange()[0] ],
+            'detection_parameters': self.detection_parameters(),
+            'auto_label':           self.auto_label_checkbox.isChecked(),
+            'save_features':        self.save_features_checkbox.isChecked(),
+            'results_directory':    self.results_directory
+        }
+
+        save_project(project_path, self.tail_angle_paths, self.video_paths, self.annotations, view)
+
+        print("Saved project '{}'.".format(project_path))
+
+    def open_project(self):
+        # let user pick a project
+        if pyqt_version == 4:
+            project_path = str(QFileDialog.getOpenFileName(self, 'Select project to open.', '', 'Project Files (*.json)'))
+        elif pyqt_version == 5:
+            project_path = str(QFileDialog.getOpenFileName(self, 'Select project to open.', '', 'Project Files (*.json)')[0])
+
+        if project_path == "":
+            return
+
+        start_time = time.time()
+
+        try:
+            recordings, view = load_project(project_path)
+        except (IOError, OSError, ValueError, KeyError, TypeError) as error:
+            QMessageBox.warning(self, "Error Opening Project", "'{}' could not be read: {}".format(project_path, error))
+            return
+
+        # recordings whose tail angles are missing are left out, and videos that are missing aren't opened
+        missing = missing_files(recordings)
+
+        recordings = [ (tail_angle_path, tail_angle_cache, video_path if video_path not in missing else None, annotations) for tail_angle_path, tail_angle_cache, video_path, annotations in recordings
+                       if tail_angle_path not in missing ]
+
+        # save the changes of the current session before closing it
+        self.autosave_timer.stop()
+        self.wait_for_autosave()
+
+        jobs = self.changed_recordings()
+        if len(jobs) > 0:
+            self.write_behaviors(jobs)
+
+        self.stop_playback()
+        self.clear_grid()
+        self.clear_plot_items()
+        self.videos.release_all()
+        self.tail_angles_list.clear()
+        self.video_plot.clear()
+        self.set_initial_state()
+
+        # only the names of the files are needed now. tail angles and videos are loaded when they are selected,
+        # the tail angles straight from the caches the project refers to
+        for tail_angle_path, tail_angle_cache, video_path, annotations in recordings:
+            self.add_tail_angles(tail_angle_path, annotations=annotations, cache=tail_angle_cache)
+
+            if video_path is not None:
+                self.video_paths[-1] = video_path
+                self.videos[-1]      = video_path
+
+        self.results_directory = view.get('results_directory')
+
+        # changes made after the project was saved may have been autosaved
+        self.restore_autosaves(list(range(len(recordings))), os.path.getmtime(project_path))
+
+        for name, value in view.get('detection_parameters', {}).items():
+            if name in self.detection_boxes:
+                self.detection_boxes[name].blockSignals(True)
+                self.detection_boxes[name].setValue(value)
+                self.detection_boxes[name].blockSignals(False)
+
+        self.auto_label_checkbox.blockSignals(True)
+        self.auto_label_checkbox.setChecked(view.get('auto_label', False))
+        self.auto_label_checkbox.blockSignals(False)
+
+        self.save_features_checkbox.setChecked(view.get('save_features', False))
+
+        if len(recordings) > 0:
+            self.selected_tail_angles = min(max(view.get('selected', 0), 0), len(recordings) - 1)
+
+            self.tail_angles_list.blockSignals(True)
+            self.tail_angles_list.setCurrentRow(self.selected_tail_angles)
+            self.tail_angles_list.blockSignals(False)
+
+            try:
+                self.item_selected(force_update=True)
+            except (IOError, OSError, ValueError) as error:
+                QMessageBox.warning(self, "Error Opening Project", "'{}' could not be read: {}".format(self.tail_angle_paths[self.selected_tail_angles], error))
+
+            if 'x_range' in view:
+                self.tail_plot.vb.setXRange(view['x_range'][0], view['x_range'][1], padding=0)
+
+        print("Opened project '{}' with {} recordings in {:.2f} s.".format(project_path, len(recordings), time.time() - start_time))
+        if len(missing) > 0:
+            message_box = QMessageBox(QMessageBox.Warning, "Missing Files", "{} files of the project could not be found. Recordings without their tail angles were left out.".format(len(missing)), QMessageBox.Ok, self)
+            message_box.setDetailedText("\n".join(missing))
+            message_box.exec_()
+
+    def autosave(self):
+        # save the behaviors of changed recordings on a background thread
+        if self.autosave_thread is not None and self.autosave_thread.is_alive():
+            self.autosave_timer.start()
+            return
+
+        jobs = self.changed_recordings()
+
+        if len(jobs) > 0:
+            self.autosave_thread = threading.Thread(target=self.write_behaviors, args=(jobs,))
+            self.autosave_thread.daemon = True
+            self.autosave_thread.start()
+
+    def wait_for_autosave(self):
+        if self.autosave_thread is not None:
+            self.autosave_thread.join()
+            self.autosave_thread = None
+
+    def changed_recordings(self):
+        # return (behaviors path, tail angle path, version, copy of the behaviors) of recordings that changed since
+        # they were last saved, to the results files or to the database
+        jobs = []
+        for i in range(len(self.tail_angles)):
+            if self.results_directory is not None:
+                path = behaviors_path(self.results_directory, self.tail_angle_paths[i])
             else:
-                video_name = name
+                path = self.autosave_path(self.tail_angle_paths[i])
+
+            version = self.annotations[i].version
+
+            # recordings that were never edited are only saved when saving results
+            changed = self.saved_versions.get(path, 0) != version
+            if self.database is not None:
+                changed = changed or self.saved_versions.get((self.database.path, self.tail_angle_paths[i]), 0) != version
+
+            if changed:
+                annotations = [ Annotation(annotation.label, annotation.start_time, annotation.end_time, annotation.proposed) for annotation in self.annotations[i] ]
+
+                jobs.append((path, self.tail_angle_paths[i], version, annotations))
+
+        return jobs
+
+    def write_behaviors(self, jobs):
+        for path, tail_angle_path, version, annotations in jobs:
+            try:
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+
+                # autosaves keep which behaviors are proposed, so that they can be restored as they were
+                save_behaviors(path, annotations, mark_proposed=os.path.dirname(path) == autosave_directory)
+
+                self.saved_versions[path] = version
+            except (IOError, OSError) as error:
+                print("Could not save behaviors to '{}': {}".format(path, error))
+
+        print("Saved {} changed recordings to '{}'.".format(len(jobs), os.path.dirname(jobs[0][0])))
+
+        if self.database is not None:
+            self.write_database([ (tail_angle_path, version, annotations) for path, tail_angle_path, version, annotations in jobs ])
+
+    def autosave_path(self, tail_angle_path):
+        return os.path.join(autosave_directory, "{}_behaviors.csv".format(cache_key(tail_angle_path)))
+
+    def restore_autosaves(self, indices, saved_time):
+        # offer to restore the autosaved behaviors of recordings that are newer than the behaviors they were loaded with
+        indices = [ i for i in indices if os.path.exists(self.autosave_path(self.tail_angle_paths[i]))
+                    and os.path.getmtime(self.autosave_path(self.tail_angle_paths[i])) > saved_time ]
+
+        if len(indices) == 0:
+            return
+
+        message_box = QMessageBox(QMessageBox.Question, "Restore Autosaved Behaviors", "{} recordings have autosaved behaviors that were never saved. Restore them?".format(len(indices)),
+                                  QMessageBox.Yes | QMessageBox.No, self)
+        message_box.setDetailedText("\n".join([ self.tail_angle_paths[i] for i in indices ]))
 
-            with open(os.path.join(directory, '{}_behaviors.csv'.format(video_name)), mode='w') as file:
-                writer = csv.writer(file, delimiter=',')
-                writer.writerow(['Behavior', 'Start Time (s)', 'End Time (s)'])
-                for j in range(len(self.behaviors[i])):
-                    writer.writerow([self.behaviors[i][j], str(self.behavior_times[i][j][0]), str(self.behavior_times[i][j][1])])
+        if message_box.exec_() != QMessageBox.Yes:
+            return
+
+        # behaviors of the selected recording are drawn, so their items are put back in the pool first
+        if self.selected_tail_angles in indices:
+            self.clear_plot_items()
+
+        n_restored = 0
+        for i in indices:
+            try:
+                behaviors = load_behaviors(self.autosave_path(self.tail_angle_paths[i]))
+            except (IOError, OSError, ValueError, IndexError) as error:
+                print("Could not restore behaviors from '{}': {}".format(self.autosave_path(self.tail_angle_paths[i]), error))
+                continue
+
+            # restored behaviors count as changes, so that they are saved again
+            self.annotations[i] = AnnotationStore(on_change=self.autosave_timer.start, annotations=behaviors)
+            self.annotations[i].changed()
+
+            n_restored += 1
+
+        print("Restored the autosaved behaviors of {} recordings.".format(n_restored))
+
+        if self.selected_tail_angles in indices:
+            self.update_shown_behaviors()
+
+    def write_database(self, recordings):
+        # save (tail angle path, version, behaviors) of recordings to the database, in one transaction. this is
+        # called from the autosave thread as well
+        if len(recordings) == 0:
+            return
+
+        try:
+            self.database.save_recordings([ (tail_angle_path, annotations) for tail_angle_path, version, annotations in recordings ])
+        except sqlite3.Error as error:
+            print("Could not save behaviors to '{}': {}".format(self.database.path, error))
+            return
+
+        for tail_angle_path, version, annotations in recordings:
+            self.saved_versions[(self.database.path, tail_angle_path)] = version
+
+        print("Saved {} recordings to '{}'.".format(len(recordings), self.database.path))
+
+    def closeEvent(self, event):
+        # save any changes that are still waiting, and stop the threads reading videos
+        self.stop_playback()
+        self.autosave_timer.stop()
+        self.wait_for_autosave()
+
+        jobs = self.changed_recordings()
+        if len(jobs) > 0:
+            self.write_behaviors(jobs)
+
+        self.videos.release_all()
+
+        if profiler.enabled:
+            print(profiler.report())
+
+            profiler.dump_trace(profile_trace_path)
+            print("Saved trace to '{}'.".format(profile_trace_path))
+
+        event.accept()
+
+    def update_profile_overlay(self):
+        # show the latency of frame fetches and the rate at which preview frames were shown since the last update
+        now = time.time()
+        fps = (self.frames_shown - self.profile_frames_shown)/(now - self.profile_time)
+
+        self.profile_time         = now
+        self.profile_frames_shown = self.frames_shown
+
+        text = "Preview: {:.0f} fps".format(fps)
+
+        for name, label in [('frame_fetch', "Frame fetch"), ('frame_fetch.proxy', "Proxy fetch"), ('mouse_moved', "Mouse moved")]:
+            histogram = profiler.histograms.get(name)
+
+            if histogram is not None:
+                text += "\n{}: p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms".format(label, 1000*histogram.percentile(50), 1000*histogram.percentile(95), 1000*histogram.percentile(99))
+
+        self.profile_label.setText(text)
+        self.profile_label.adjustSize()
 
     def create_round_icon(self, color):
         pixmap = QPixmap(40, 40)
@@ -674,6 +1885,17 @@ class Window(QMainWindow):
         return icon
 
 if __name__ == "__main__":
+    # time the hot paths and show the preview latency, eg. "python gui.py --profile"
+    if "--profile" in sys.argv:
+        profiler.enabled = True
+
+    # print the time taken to import each module and create each part of the window, eg. "python gui.py --profile-startup"
+    if "--profile-startup" in sys.argv:
+        profile_startup = True
+
+    if "--database" in sys.argv:
+        annotation_database_path = sys.argv[sys.argv.index("--database") + 1]
+
     app = QApplication(sys.argv)
 
     if pyqt_version == 5:
@@ -681,6 +1903,8 @@ if __name__ == "__main__":
         app.setAttribute(Qt.AA_UseHighDpiPixmaps)
         app.setAttribute(Qt.AA_EnableHighDpiScaling)
 
+    startup_profiler.mark("QApplication")
+
     # create window
     window = Window()
 
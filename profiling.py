@@ -0,0 +1,216 @@
+import os
+import json
+import math
+import time
+import bisect
+import importlib
+import threading
+import collections
+
+# latency histograms and a trace of timed stages. everything is skipped while the profiler is disabled,
+# which leaves one attribute check per timed call. only the standard library is imported, so that this
+# can be imported first to time starting up
+
+# histogram buckets are spaced logarithmically from 1 us to 100 s, with this many buckets per factor of 10
+buckets_per_decade = 20
+min_latency        = 1e-6
+n_buckets          = 8*buckets_per_decade + 1
+
+# maximum number of events kept for the trace
+max_trace_events = 200000
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = [0]*n_buckets
+        self.total  = 0.0
+        self.max    = 0.0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def add(self, duration):
+        if duration > min_latency:
+            bucket = min(int(math.log10(duration/min_latency)*buckets_per_decade), n_buckets - 1)
+        else:
+            bucket = 0
+
+        self.counts[bucket] += 1
+        self.total          += duration
+        self.max             = max(self.max, duration)
+
+    def percentile(self, percent):
+        # upper edge of the bucket containing the percentile (s)
+        n = len(self)
+        if n == 0:
+            return 0.0
+
+        cumulative_counts = []
+        for count in self.counts:
+            cumulative_counts.append(count + (cumulative_counts[-1] if cumulative_counts else 0))
+
+        bucket = bisect.bisect_left(cumulative_counts, percent/100.0*n)
+
+        return min(min_latency*10**((bucket + 1)/float(buckets_per_decade)), self.max)
+
+    def mean(self):
+        return self.total/max(len(self), 1)
+
+class Stage(object):
+    # times the code inside a with block
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name     = name
+
+    def __enter__(self):
+        self.start_time = time.time()
+
+    def __exit__(self, *exception):
+        self.profiler.record(self.name, time.time() - self.start_time, self.start_time)
+
+class NullStage(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exception):
+        pass
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled    = False
+        self.histograms = collections.OrderedDict()
+        self.trace      = collections.deque(maxlen=max_trace_events)
+        self.lock       = threading.Lock()
+        self.null_stage = NullStage()
+
+    def stage(self, name):
+        if not self.enabled:
+            return self.null_stage
+
+        return Stage(self, name)
+
+    def record(self, name, duration, start_time=None):
+        if not self.enabled:
+            return
+
+        if start_time is None:
+            start_time = time.time() - duration
+
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram()
+
+            self.histograms[name].add(duration)
+            self.trace.append((name, start_time, duration, threading.current_thread().name))
+
+    def report(self):
+        # return a table of the latency of each stage, in ms
+        lines = ["{:<40} {:>8} {:>9} {:>9} {:>9} {:>9}".format("Stage", "Count", "Mean", "p50", "p95", "p99")]
+
+        with self.lock:
+            for name, histogram in self.histograms.items():
+                lines.append("{:<40} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(name, len(histogram), 1000*histogram.mean(), 1000*histogram.percentile(50),
+                                                                                      1000*histogram.percentile(95), 1000*histogram.percentile(99)))
+
+        return "\n".join(lines)
+
+    def dump_trace(self, path):
+        # write the trace in the Chrome trace event format, which can be opened in chrome://tracing or Perfetto
+        with self.lock:
+            events = list(self.trace)
+
+        threads = {}
+        for _, _, _, thread in events:
+            threads.setdefault(thread, len(threads))
+
+        trace_events = [ {'name': name, 'ph': 'X', 'ts': start_time*1e6, 'dur': duration*1e6, 'pid': os.getpid(), 'tid': threads[thread]} for name, start_time, duration, thread in events ]
+        trace_events += [ {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': thread}} for thread, tid in threads.items() ]
+
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': trace_events}, file)
+
+profiler = Profiler()
+
+class StartupStage(object):
+    # times an import or other step inside a longer step of starting up
+    def __init__(self, startup_profiler, name):
+        self.startup_profiler = startup_profiler
+        self.name             = name
+
+    def __enter__(self):
+        self.start_time = time.time()
+
+    def __exit__(self, *exception):
+        self.startup_profiler.record(self.name, time.time() - self.start_time)
+
+class StartupProfiler(object):
+    # times the steps of starting up, from when this module is imported. a step lasts from the end of the
+    # previous one, except for steps timed inside it, eg. imports, which are left out of it
+    def __init__(self):
+        self.start_time = time.time()
+        self.last_time  = self.start_time
+        self.steps      = []
+        self.lock       = threading.Lock()
+
+    def step(self, name):
+        return StartupStage(self, name)
+
+    def record(self, name, duration):
+        with self.lock:
+            self.steps.append((name, duration, time.time() - self.start_time))
+            self.last_time += duration
+
+    def mark(self, name):
+        # end a step
+        with self.lock:
+            now = time.time()
+
+            self.steps.append((name, now - self.last_time, now - self.start_time))
+            self.last_time = now
+
+    def report(self):
+        # return a table of the time taken by each step and the time since starting when it ended, in ms
+        lines = ["{:<40} {:>9} {:>9}".format("Step", "Time", "Total")]
+
+        with self.lock:
+            for name, duration, end_time in self.steps:
+                lines.append("{:<40} {:>9.1f} {:>9.1f}".format(name, 1000*duration, 1000*end_time))
+
+        return "\n".join(lines)
+
+startup_profiler = StartupProfiler()
+
+class LazyModule(object):
+    # stands in for a module that takes long to import, importing it the first time one of its attributes is used
+    def __init__(self, name):
+        self.name   = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            with startup_profiler.step("import " + self.name):
+                self.module = importlib.import_module(self.name)
+
+        return getattr(self.module, attribute)
+
+def profiled(name):
+    # decorator that times every call of a function. arguments beyond the ones the function takes are dropped,
+    # like Qt does when a signal with more arguments is connected to a method
+    def decorator(function):
+        n_arguments = function.__code__.co_argcount
+
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args[:n_arguments], **kwargs)
+
+            start_time = time.time()
+            try:
+                return function(*args[:n_arguments], **kwargs)
+            finally:
+                profiler.record(name, time.time() - start_time, start_time)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__  = function.__doc__
+
+        return wrapper
+
+    return decorator
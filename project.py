@@ -0,0 +1,62 @@
+import os
+import json
+
+from tail_angles import cache_path
+from results import replace_file
+
+# a project holds everything needed to continue a session: the recordings with their videos and behaviors,
+# and the view. it only refers to the tail angle files and their caches, which are memory-mapped when needed
+
+project_version = 1
+
+def save_project(path, tail_angle_paths, video_paths, annotations, view):
+    recordings = []
+    for tail_angle_path, video_path, store in zip(tail_angle_paths, video_paths, annotations):
+        recordings.append({
+            'tail_angles':      tail_angle_path,
+            'tail_angle_cache': tail_angle_cache(tail_angle_path),
+            'video':            video_path,
+            'behaviors':        [ [annotation.label, annotation.start_time, annotation.end_time, annotation.proposed] for annotation in store ]
+        })
+
+    # write to a temporary file first, so that a crash while saving never leaves a truncated project
+    temp_path = path + ".tmp"
+    with open(temp_path, mode='w') as file:
+        json.dump({'version': project_version, 'recordings': recordings, 'view': view}, file)
+    replace_file(temp_path, path)
+
+def tail_angle_cache(tail_angle_path):
+    # the cache file of a tail angle file, or None if the file can't be found
+    try:
+        cache = cache_path(tail_angle_path)
+    except OSError:
+        return None
+
+    return cache if os.path.exists(cache) else None
+
+def load_project(path):
+    # return the recordings of a project as (tail angle path, tail angle cache, video path, behaviors) and the view,
+    # where behaviors are (label, start time, end time, proposed). the cache is None if it wasn't saved
+    with open(path) as file:
+        project = json.load(file)
+
+    if project.get('version', 0) > project_version:
+        raise ValueError("'{}' was saved by a newer version.".format(path))
+
+    recordings = [ (str(recording['tail_angles']), str(recording['tail_angle_cache']) if recording.get('tail_angle_cache') is not None else None,
+                    str(recording['video']) if recording['video'] is not None else None,
+                    [ (str(label), start_time, end_time, proposed) for label, start_time, end_time, proposed in recording['behaviors'] ])
+                   for recording in project['recordings'] ]
+
+    return recordings, project.get('view', {})
+
+def missing_files(recordings):
+    # return the files of a project's recordings that no longer exist
+    missing = []
+    for tail_angle_path, tail_angle_cache, video_path, behaviors in recordings:
+        if not os.path.exists(tail_angle_path):
+            missing.append(tail_angle_path)
+        if video_path is not None and not os.path.exists(video_path):
+            missing.append(video_path)
+
+    return missing
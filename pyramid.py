@@ -0,0 +1,120 @@
+import os
+import glob
+import zipfile
+import numpy as np
+
+from tail_angles import cache_dir, cache_key, cache_path
+from results import replace_file
+
+class MinMaxPyramid(object):
+    # minimum and maximum of a signal over bins that grow by a constant factor at each level, so that any window
+    # of the signal can be drawn with a bounded number of points while still showing every peak
+    def __init__(self, signal, levels):
+        self.signal = signal
+        self.levels = levels # list of (bin size, minimums, maximums)
+
+    @classmethod
+    def build(cls, signal, factor=4, min_bins=512):
+        levels = []
+
+        bin_size = 1
+        mins     = signal
+        maxs     = signal
+        while len(mins) > min_bins:
+            bin_size *= factor
+
+            # pad the previous level with NaNs so that it splits into whole bins, which fmin and fmax ignore
+            n_bins = int(np.ceil(len(mins)/float(factor)))
+            mins   = pad(mins, n_bins*factor).reshape((n_bins, factor))
+            maxs   = pad(maxs, n_bins*factor).reshape((n_bins, factor))
+            mins   = np.fmin.reduce(mins, axis=1).astype(np.float32)
+            maxs   = np.fmax.reduce(maxs, axis=1).astype(np.float32)
+
+            levels.append((bin_size, mins, maxs))
+
+        return cls(signal, levels)
+
+    def get_window(self, start, end, max_points):
+        # return sample positions and values covering samples start to end, using the finest level that fits in max_points
+        start = max(start, 0)
+        end   = min(end, len(self.signal)-1)
+
+        if end < start:
+            return np.zeros(0), np.zeros(0)
+
+        level    = -1
+        n_points = end - start + 1
+        while n_points > max_points and level + 1 < len(self.levels):
+            level   += 1
+            n_points = 2*(end//self.levels[level][0] - start//self.levels[level][0] + 1)
+
+        if level == -1:
+            return np.arange(start, end+1), self.signal[start:end+1]
+
+        bin_size, mins, maxs = self.levels[level]
+
+        start_bin = start//bin_size
+        end_bin   = end//bin_size + 1
+
+        # each bin is drawn as a vertical line from its minimum to its maximum
+        x = np.repeat(np.arange(start_bin, end_bin)*bin_size + (bin_size - 1)/2.0, 2)
+        y = np.empty(x.shape[0], dtype=mins.dtype)
+        y[0::2] = mins[start_bin:end_bin]
+        y[1::2] = maxs[start_bin:end_bin]
+
+        return x, y
+
+    def extrema(self):
+        # minimum and maximum of the whole signal
+        if len(self.levels) > 0:
+            _, mins, maxs = self.levels[-1]
+        else:
+            mins = maxs = self.signal
+
+        return float(np.nanmin(mins)), float(np.nanmax(maxs))
+
+def pad(values, length):
+    padded = np.full(length, np.nan, dtype=np.float32)
+    padded[:len(values)] = values
+
+    return padded
+
+def pyramid_cache_path(tail_angle_path):
+    return cache_path(tail_angle_path)[:-len(".npy")] + "_pyramid.npz"
+
+def load_pyramid(tail_angle_path, signal):
+    # load the pyramid of a signal computed from a tail angle file from the cache, or build it and add it to the cache
+    try:
+        with np.load(pyramid_cache_path(tail_angle_path)) as data:
+            levels = [ (int(data['bin_size_{}'.format(i)]), data['mins_{}'.format(i)], data['maxs_{}'.format(i)]) for i in range(int(data['n_levels'])) ]
+
+        return MinMaxPyramid(signal, levels)
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        pass
+
+    pyramid = MinMaxPyramid.build(signal)
+
+    try:
+        # remove pyramids left over from older versions of the file
+        for old_path in glob.glob(os.path.join(cache_dir, "{}_*_pyramid.npz".format(cache_key(tail_angle_path)))):
+            os.remove(old_path)
+
+        arrays = {'n_levels': len(pyramid.levels)}
+        for i, (bin_size, mins, maxs) in enumerate(pyramid.levels):
+            arrays['bin_size_{}'.format(i)] = bin_size
+            arrays['mins_{}'.format(i)]     = mins
+            arrays['maxs_{}'.format(i)]     = maxs
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file first, so that an interrupted write never leaves a truncated cache file
+        path      = pyramid_cache_path(tail_angle_path)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        replace_file(temp_path, path)
+    except (IOError, OSError):
+        print("Could not write pyramid cache for '{}'.".format(tail_angle_path))
+
+    return pyramid
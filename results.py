@@ -0,0 +1,63 @@
+import os
+import csv
+
+from features import feature_names
+
+def video_name(tail_angle_path):
+    # results are named after the video, which is the tail angle file name without "_tail_angles"
+    base_name = os.path.basename(tail_angle_path)
+    name      = os.path.splitext(base_name)[0]
+
+    if tail_angle_path.endswith("_tail_angles.csv"):
+        return name.split("_tail_angles")[0]
+    else:
+        return name
+
+def behaviors_path(directory, tail_angle_path):
+    return os.path.join(directory, '{}_behaviors.csv'.format(video_name(tail_angle_path)))
+
+def features_path(directory, tail_angle_path):
+    return os.path.join(directory, '{}_bout_features.csv'.format(video_name(tail_angle_path)))
+
+def save_behaviors(path, annotations, mark_proposed=False):
+    # proposed behaviors are only told apart from confirmed ones in an extra Proposed column if asked for,
+    # since other programs read the three columns
+    header = ['Behavior', 'Start Time (s)', 'End Time (s)'] + (['Proposed'] if mark_proposed else [])
+
+    # write to a temporary file first, so that a crash while saving never leaves a truncated file
+    temp_path = path + ".tmp"
+    with open(temp_path, mode='w') as file:
+        writer = csv.writer(file, delimiter=',')
+        writer.writerow(header)
+        for annotation in annotations:
+            writer.writerow([annotation.label, str(annotation.start_time), str(annotation.end_time)] + ([str(bool(annotation.proposed))] if mark_proposed else []))
+    replace_file(temp_path, path)
+
+def load_behaviors(path):
+    # return the behaviors saved by save_behaviors as (label, start time, end time, proposed). behaviors of
+    # files without a Proposed column count as confirmed
+    with open(path) as file:
+        reader = csv.reader(file, delimiter=',')
+        next(reader)
+
+        return [ (row[0], float(row[1]), float(row[2]), len(row) > 3 and row[3] == str(True)) for row in reader if len(row) > 0 ]
+
+def save_features(path, annotations, columns, mark_proposed=False):
+    # save the behaviors along with the features of their bouts, one row per behavior
+    temp_path = path + ".tmp"
+    with open(temp_path, mode='w') as file:
+        writer = csv.writer(file, delimiter=',')
+        writer.writerow(['Behavior', 'Start Time (s)', 'End Time (s)'] + (['Proposed'] if mark_proposed else []) + feature_names)
+        for i, annotation in enumerate(annotations):
+            writer.writerow([annotation.label, str(annotation.start_time), str(annotation.end_time)] + ([str(bool(annotation.proposed))] if mark_proposed else []) + [ str(columns[name][i]) for name in feature_names ])
+    replace_file(temp_path, path)
+
+def replace_file(temp_path, path):
+    try:
+        # atomic, even if the file exists
+        os.replace(temp_path, path)
+    except AttributeError:
+        # Python 2 can only rename over an existing file on POSIX
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
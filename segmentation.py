@@ -0,0 +1,72 @@
+import numpy as np
+
+# default parameters of the bout detector. times are in ms, angles are in the units of the tail angle files
+default_parameters = {
+    'velocity_threshold': 500.0, # smoothed angular velocity of the tail tip above which the fish is moving (angle/s)
+    'smoothing_time':     10.0,  # width of the moving average applied to the angular velocity
+    'min_duration':       20.0,  # shorter bouts are discarded
+    'max_gap':            50.0,  # bouts separated by shorter gaps are merged
+    'c_bend_angle':       60.0   # bouts with a larger peak tip angle are proposed as C-Bends
+}
+
+def detect_bouts(tip_angles, framerate, velocity_threshold=default_parameters['velocity_threshold'], smoothing_time=default_parameters['smoothing_time'],
+                 min_duration=default_parameters['min_duration'], max_gap=default_parameters['max_gap']):
+    # return the first frames and the frames after the last frames of the bouts in a tip angle trace
+    tip_angles = np.asarray(tip_angles, dtype=np.float32)
+
+    if len(tip_angles) < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # frames where the tail wasn't tracked are NaN, and are treated as if the tail didn't move
+    velocity = np.zeros(len(tip_angles), dtype=np.float32)
+    velocity[1:] = np.abs(np.diff(tip_angles))*framerate
+    velocity[np.isnan(velocity)] = 0
+
+    window   = max(int(round(smoothing_time*framerate/1000.0)), 1)
+    velocity = np.convolve(velocity, np.ones(window, dtype=np.float32)/window, mode='same')
+
+    # find the edges of the runs of frames above the threshold
+    moving = np.zeros(len(velocity) + 2, dtype=np.int8)
+    moving[1:-1] = velocity > velocity_threshold
+    edges  = np.diff(moving)
+    starts = np.nonzero(edges == 1)[0]
+    ends   = np.nonzero(edges == -1)[0]
+
+    # merge bouts separated by short gaps
+    if len(starts) > 1:
+        separate = (starts[1:] - ends[:-1]) > max_gap*framerate/1000.0
+        starts   = starts[np.concatenate(([True], separate))]
+        ends     = ends[np.concatenate((separate, [True]))]
+
+    long_enough = (ends - starts) >= min_duration*framerate/1000.0
+
+    return starts[long_enough], ends[long_enough]
+
+def classify_bouts(tip_angles, starts, ends, c_bend_angle=default_parameters['c_bend_angle']):
+    # propose a label for each bout: bouts with a large peak tip angle are C-Bends, bouts where the tail
+    # crosses the midline at least twice are Swims and the remaining bouts are J-Turns
+    if len(starts) == 0:
+        return []
+
+    tip_angles = np.asarray(tip_angles, dtype=np.float32)
+
+    # reduce over [start, end) of every bout at once. the padding makes the last end a valid index
+    indices    = np.empty(2*len(starts), dtype=int)
+    indices[0::2] = starts
+    indices[1::2] = ends
+    peak_angles   = np.fmax.reduceat(np.append(np.abs(tip_angles), 0), indices)[0::2]
+
+    crossings   = np.zeros(len(tip_angles) + 1, dtype=int)
+    crossings[2:] = np.cumsum(np.signbit(tip_angles[1:]) != np.signbit(tip_angles[:-1]))
+    n_crossings = crossings[ends] - crossings[starts + 1]
+
+    labels = np.where(peak_angles > c_bend_angle, "C-Bend", np.where(n_crossings >= 2, "Swim", "J-Turn"))
+
+    return labels.tolist()
+
+def segment_bouts(tip_angles, framerate, c_bend_angle=default_parameters['c_bend_angle'], **parameters):
+    # return (label, start time (s), end time (s)) of the bouts in a tip angle trace
+    starts, ends = detect_bouts(tip_angles, framerate, **parameters)
+    labels       = classify_bouts(tip_angles, starts, ends, c_bend_angle=c_bend_angle)
+
+    return [ (label, int(start)/float(framerate), int(end - 1)/float(framerate)) for label, start, end in zip(labels, starts, ends) ]
@@ -0,0 +1,64 @@
+import os
+import glob
+import warnings
+import numpy as np
+
+from tail_angles import cache_dir, cache_key, cache_path
+from pyramid import load_pyramid
+from results import replace_file
+
+def compute_tip_angles(tail_angles):
+    # the angle of the tip of the tail is the mean of the angles of the last three segments
+    with warnings.catch_warnings():
+        # frames where the tail wasn't tracked are NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+
+        return np.nanmean(tail_angles[:, -3:], axis=1)
+
+class DerivedSignals(object):
+    # signals and summaries computed from the tail angles of a recording. they are computed once
+    # and only need to be computed again if the tail angles change
+    def __init__(self, tip_angles, pyramid):
+        self.tip_angles = tip_angles
+        self.pyramid    = pyramid
+        self.n_frames   = len(tip_angles)
+
+        self.min_tip_angle, self.max_tip_angle = pyramid.extrema()
+
+def tip_angles_cache_path(tail_angle_path):
+    return cache_path(tail_angle_path)[:-len(".npy")] + "_tip_angles.npy"
+
+def load_tip_angles(tail_angle_path, get_tail_angles):
+    # load the tip angles of a tail angle file from the cache, or compute them and add them to the cache.
+    # get_tail_angles is only called if the tail angles are needed
+    try:
+        return np.load(tip_angles_cache_path(tail_angle_path), mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        pass
+
+    tip_angles = compute_tip_angles(get_tail_angles())
+
+    try:
+        # remove signals left over from older versions of the file
+        for old_path in glob.glob(os.path.join(cache_dir, "{}_*_tip_angles.npy".format(cache_key(tail_angle_path)))):
+            os.remove(old_path)
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file first, so that an interrupted write never leaves a truncated cache file
+        path      = tip_angles_cache_path(tail_angle_path)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            np.save(file, tip_angles)
+        replace_file(temp_path, path)
+    except (IOError, OSError):
+        print("Could not write derived signal cache for '{}'.".format(tail_angle_path))
+
+    return tip_angles
+
+def load_derived_signals(tail_angle_path, get_tail_angles):
+    # load the derived signals of a tail angle file from the cache, or compute them and add them to the cache
+    tip_angles = load_tip_angles(tail_angle_path, get_tail_angles)
+
+    return DerivedSignals(tip_angles, load_pyramid(tail_angle_path, tip_angles))
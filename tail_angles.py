@@ -0,0 +1,314 @@
+import os
+import sys
+import glob
+import time
+import hashlib
+import warnings
+import collections
+import numpy as np
+
+from results import replace_file
+
+# frame rate of the recordings (Hz)
+framerate = 349
+
+# type used to store tail angles, either "float32" or "int16". int16 values are scaled to the range of each
+# segment, which takes a quarter of the memory of float64 with a precision of 1/32767 of the largest angle
+tail_angle_dtype = "float32"
+
+# directory where binary copies of parsed tail angle CSVs are stored
+cache_dir = os.path.join(os.path.expanduser("~"), ".behavior_classification", "cache")
+
+# running totals of parsing performed by load_tail_angles
+load_stats = {'files_parsed': 0, 'bytes_parsed': 0, 'parse_time': 0.0, 'files_cached': 0, 'cache_time': 0.0}
+
+def cache_key(tail_angle_path):
+    return hashlib.sha1(os.path.abspath(tail_angle_path).encode('utf-8')).hexdigest()
+
+def cache_path(tail_angle_path):
+    # the name of the cache file encodes the path, size and modification time of the CSV,
+    # so that any change to the CSV results in a cache miss
+    stat = os.stat(tail_angle_path)
+
+    return os.path.join(cache_dir, "{}_{}_{}_{}.npy".format(cache_key(tail_angle_path), stat.st_size, int(stat.st_mtime*1e6), tail_angle_dtype))
+
+def scales_path(tail_angle_path):
+    return cache_path(tail_angle_path)[:-len(".npy")] + "_scales.npy"
+
+class ColumnarTailAngles(object):
+    # tail angles stored one segment after another, so that some segments (eg. the tip) can be read without
+    # touching the others. indexing works like a float32 array of shape (frames, segments)
+    def __init__(self, columns, scales=None):
+        self.columns = columns # array of shape (segments, frames)
+        self.scales  = scales  # scale of each segment for int16 columns, where the minimum value means NaN
+        self.shape   = (columns.shape[1], columns.shape[0])
+        self.dtype   = np.dtype(np.float32)
+        self.nbytes  = columns.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, columns = key
+        else:
+            rows, columns = key, slice(None)
+
+        values = self.columns[columns]
+
+        if values.ndim == 1:
+            return self.decode(values[rows], self.scales[columns] if self.scales is not None else None)
+        else:
+            scales = self.scales[columns] if self.scales is not None else None
+
+            return self.decode(values[:, rows], scales).T
+
+    def decode(self, values, scales):
+        if scales is None:
+            return np.asarray(values, dtype=np.float32)
+
+        # scales apply along the first axis
+        scales = np.reshape(scales, np.shape(scales) + (1,)*(np.ndim(values) - np.ndim(scales)))
+        nans   = values == np.iinfo(np.int16).min
+
+        return np.where(nans, np.nan, values*scales).astype(np.float32)
+
+    def memory_mapped(self):
+        return isinstance(self.columns, np.memmap)
+
+def encode_tail_angles(tail_angles):
+    # convert parsed tail angles to the columns of a ColumnarTailAngles
+    columns = np.ascontiguousarray(tail_angles.T)
+
+    if tail_angle_dtype == "int16":
+        with warnings.catch_warnings():
+            # segments that were never tracked are all NaN
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            scales = (np.nanmax(np.abs(columns), axis=1)/np.iinfo(np.int16).max).astype(np.float32)
+
+        scales[~np.isfinite(scales) | (scales == 0)] = 1
+
+        nans    = np.isnan(columns)
+        columns = np.round(np.where(nans, 0, columns)/scales[:, np.newaxis]).astype(np.int16)
+        columns[nans] = np.iinfo(np.int16).min
+
+        return columns, scales
+    else:
+        return columns.astype(tail_angle_dtype), None
+
+def parse_tail_angles(tail_angle_path):
+    with open(tail_angle_path, 'rb') as file:
+        data = file.read()
+
+    # the first column holds frame numbers, the rest hold the angle of each tail segment
+    lines     = data.replace(b'\r', b'').strip(b'\n')
+    n_columns = lines.split(b'\n', 1)[0].count(b',') + 1
+    n_rows    = lines.count(b'\n') + 1
+
+    # empty fields are NaN, which only genfromtxt keeps. fromstring would skip them and shift the
+    # following values into the wrong columns
+    empty_fields = lines.startswith(b',') or lines.endswith(b',') or any(pattern in lines for pattern in (b',,', b',\n', b'\n,', b'\n\n'))
+
+    # parse all of the numbers in a single pass, which is only possible when every field is a
+    # number; headers make numpy stop early, in which case we fall back to genfromtxt
+    values = None
+    if not empty_fields:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            try:
+                values = np.fromstring(lines.decode('ascii').replace(',', ' '), sep=' ')
+            except (ValueError, UnicodeDecodeError, DeprecationWarning):
+                pass
+
+    if values is None or values.size == 0 or values.size != n_rows*n_columns:
+        values = np.genfromtxt(tail_angle_path, delimiter=",")
+    else:
+        values = values.reshape((-1, n_columns))
+
+    return np.ascontiguousarray(values[:, 1:]), len(data)
+
+def write_cache(tail_angle_path, columns, scales):
+    path = cache_path(tail_angle_path)
+
+    # remove tail angle caches left over from older versions of the CSV. the caches of derived
+    # signals, which share the prefix of the name, are cleaned up by their own writers
+    old_paths = []
+    for dtype in ("float32", "int16"):
+        old_paths += glob.glob(os.path.join(cache_dir, "{}_*_*_{}.npy".format(cache_key(tail_angle_path), dtype)))
+        old_paths += glob.glob(os.path.join(cache_dir, "{}_*_*_{}_scales.npy".format(cache_key(tail_angle_path), dtype)))
+
+    for old_path in old_paths:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    # the scales are written first, since the data file existing means the cache is complete
+    if scales is not None:
+        temp_path = scales_path(tail_angle_path) + ".tmp"
+        with open(temp_path, 'wb') as file:
+            np.save(file, scales)
+        replace_file(temp_path, scales_path(tail_angle_path))
+
+    # write to a temporary file first so that an interrupted write never leaves a truncated cache file
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        np.save(file, columns)
+    replace_file(temp_path, path)
+
+def read_cache(tail_angle_path, path=None):
+    # the cache file can be given, in which case the CSV isn't looked at
+    if path is None:
+        path = cache_path(tail_angle_path)
+
+    columns = np.load(path, mmap_mode='r')
+
+    if columns.dtype == np.int16:
+        scales = np.load(path[:-len(".npy")] + "_scales.npy")
+    else:
+        scales = None
+
+    return ColumnarTailAngles(columns, scales)
+
+def load_tail_angles(tail_angle_path, use_cache=True, cache=None):
+    # cache is the path of a cache file known to hold the tail angles, such as the one referred to by a project.
+    # it is memory-mapped without checking the CSV, which is only read if the cache can't be
+    if use_cache:
+        for path in ([cache] if cache is not None else []) + [None]:
+            start_time = time.time()
+            try:
+                tail_angles = read_cache(tail_angle_path, path)
+
+                load_stats['files_cached'] += 1
+                load_stats['cache_time']   += time.time() - start_time
+
+                return tail_angles
+            except (IOError, OSError, ValueError):
+                pass
+
+    start_time = time.time()
+
+    parsed_tail_angles, n_bytes = parse_tail_angles(tail_angle_path)
+
+    columns, scales = encode_tail_angles(parsed_tail_angles)
+    tail_angles     = ColumnarTailAngles(columns, scales)
+
+    parse_time = time.time() - start_time
+
+    load_stats['files_parsed'] += 1
+    load_stats['bytes_parsed'] += n_bytes
+    load_stats['parse_time']   += parse_time
+
+    print("Parsed '{}' ({:.1f} MB) in {:.2f} s ({:.1f} MB/s).".format(tail_angle_path, n_bytes/1e6, parse_time, n_bytes/1e6/max(parse_time, 1e-6)))
+
+    if use_cache:
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            write_cache(tail_angle_path, columns, scales)
+
+            # hand back the memory-mapped copy so parsed and cached arrays behave the same
+            tail_angles = read_cache(tail_angle_path)
+        except (IOError, OSError):
+            print("Could not write cache for '{}'.".format(tail_angle_path))
+
+    return tail_angles
+
+def preload_tail_angles(tail_angle_path):
+    # run in a worker process: parse a CSV into the cache, so that the main process can memory-map it.
+    # the array itself is only sent back if it could not be cached
+    try:
+        tail_angles = load_tail_angles(tail_angle_path)
+    except Exception as error:
+        return tail_angle_path, None, str(error)
+
+    if tail_angles.memory_mapped():
+        return tail_angle_path, None, None
+    else:
+        return tail_angle_path, tail_angles, None
+
+class TailAngleStore(object):
+    # list-like container of imported tail angles that only keeps the paths of the files, loading arrays
+    # when they are accessed and dropping the least recently used ones when their total size goes over
+    # the memory budget (in MB). dropped arrays are loaded again, from the cache, the next time they are accessed
+    def __init__(self, memory_budget=2000):
+        self.memory_budget = memory_budget
+        self.paths         = []
+        self.caches        = {} # cache files of paths, known without looking at the CSVs
+        self.loaded        = collections.OrderedDict()
+        self.loaded_bytes  = 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        tail_angle_path = self.paths[index]
+
+        if tail_angle_path in self.loaded:
+            # move to the end of the queue
+            tail_angles = self.loaded.pop(tail_angle_path)
+            self.loaded[tail_angle_path] = tail_angles
+        else:
+            tail_angles = load_tail_angles(tail_angle_path, cache=self.caches.get(tail_angle_path))
+            self.keep(tail_angle_path, tail_angles)
+
+        return tail_angles
+
+    def __delitem__(self, index):
+        tail_angle_path = self.paths.pop(index)
+
+        if tail_angle_path in self.loaded:
+            self.loaded_bytes -= self.loaded.pop(tail_angle_path).nbytes
+
+        if tail_angle_path not in self.paths:
+            self.caches.pop(tail_angle_path, None)
+
+    def append(self, tail_angle_path, tail_angles=None, cache=None):
+        self.paths.append(tail_angle_path)
+
+        if cache is not None:
+            self.caches[tail_angle_path] = cache
+
+        if tail_angles is not None:
+            self.keep(tail_angle_path, tail_angles)
+
+    def keep(self, tail_angle_path, tail_angles):
+        # a path that is already loaded is replaced, so its size is only counted once
+        if tail_angle_path in self.loaded:
+            self.loaded_bytes -= self.loaded.pop(tail_angle_path).nbytes
+
+        self.loaded[tail_angle_path] = tail_angles
+        self.loaded_bytes += tail_angles.nbytes
+
+        # drop least recently used arrays, always keeping the one that was just added
+        while self.loaded_bytes > self.memory_budget*1e6 and len(self.loaded) > 1:
+            _, old_tail_angles = self.loaded.popitem(last=False)
+            self.loaded_bytes -= old_tail_angles.nbytes
+
+def print_load_stats():
+    if load_stats['files_parsed'] > 0:
+        print("Parsed {} files ({:.1f} MB) in {:.2f} s ({:.1f} MB/s).".format(load_stats['files_parsed'], load_stats['bytes_parsed']/1e6, load_stats['parse_time'], load_stats['bytes_parsed']/1e6/max(load_stats['parse_time'], 1e-6)))
+    if load_stats['files_cached'] > 0:
+        print("Loaded {} files from the cache in {:.2f} s.".format(load_stats['files_cached'], load_stats['cache_time']))
+
+if __name__ == "__main__":
+    # load every tail angle CSV in a folder and report throughput, eg. "python tail_angles.py /path/to/experiment [--no-cache] [--int16]"
+    directory = sys.argv[1]
+    use_cache = "--no-cache" not in sys.argv[2:]
+
+    if "--int16" in sys.argv[2:]:
+        tail_angle_dtype = "int16"
+
+    tail_angle_paths = sorted(glob.glob(os.path.join(directory, '*.csv')))
+
+    start_time = time.time()
+
+    for tail_angle_path in tail_angle_paths:
+        try:
+            load_tail_angles(tail_angle_path, use_cache=use_cache)
+        except:
+            print("Error reading file '{}'.".format(tail_angle_path))
+
+    print_load_stats()
+    print("Loaded {} files in {:.2f} s.".format(len(tail_angle_paths), time.time() - start_time))
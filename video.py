@@ -0,0 +1,873 @@
+import os
+import sys
+import time
+import glob
+import struct
+import zipfile
+import threading
+import collections
+import multiprocessing
+import numpy as np
+
+from profiling import profiler, profiled, LazyModule
+from results import replace_file
+
+# opencv takes long to import, so it is only imported once a video is opened
+cv2 = LazyModule('cv2')
+
+# codecs where every frame can be decoded on its own
+mjpeg_fourccs = [b'MJPG', b'mjpg', b'AVRn', b'jpeg', b'JPEG']
+raw_fourccs   = [b'\x00\x00\x00\x00', b'DIB ', b'RGB ', b'raw ']
+
+# flag marking keyframes in idx1 entries
+AVIIF_KEYFRAME = 0x10
+
+# during playback, frames are skipped by reading without decoding, unless this many frames or more have to be skipped
+max_grab_frames = 100
+
+class SeekIndex(object):
+    # position in the file, size and keyframe flag of every frame of an AVI video
+    def __init__(self, offsets, sizes, keyframes, fourcc, width, height, bit_count):
+        self.offsets   = offsets
+        self.sizes     = sizes
+        self.keyframes = keyframes
+        self.fourcc    = fourcc
+        self.width     = width
+        self.height    = height
+        self.bit_count = bit_count
+
+        self.keyframe_nums = np.flatnonzero(keyframes)
+        self.intra_only    = fourcc in mjpeg_fourccs or (fourcc in raw_fourccs and bit_count == 24)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keyframe_before(self, frame_num):
+        i = np.searchsorted(self.keyframe_nums, frame_num, side='right') - 1
+
+        return int(self.keyframe_nums[i]) if i >= 0 else 0
+
+    def read_frame(self, file, frame_num):
+        # read and decode a frame straight from the file, which only works for intra-only codecs
+        file.seek(int(self.offsets[frame_num]))
+        data = np.frombuffer(file.read(int(self.sizes[frame_num])), dtype=np.uint8)
+
+        if self.fourcc in mjpeg_fourccs:
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        else:
+            # uncompressed frames are stored as rows of BGR pixels padded to 4 bytes, bottom row first
+            height    = abs(self.height)
+            row_bytes = ((self.width*self.bit_count + 31)//32)*4
+            frame     = data[:row_bytes*height].reshape((height, row_bytes))[:, :3*self.width].reshape((height, self.width, 3))
+
+            return frame[::-1] if self.height > 0 else frame
+
+def iterate_chunks(file, start, end):
+    # yield the id, data position and size of the RIFF chunks between two positions of a file
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        chunk_id, size = struct.unpack('<4sI', file.read(8))
+
+        yield chunk_id, position + 8, size
+
+        position += 8 + size + (size & 1)
+
+def build_seek_index(video_path):
+    with open(video_path, 'rb') as file:
+        file_size = os.fstat(file.fileno()).st_size
+
+        video_stream = None
+        fourcc       = None
+        width        = None
+        height       = None
+        bit_count    = None
+        super_index  = None
+        idx1         = None
+        movi_lists   = []
+
+        # an AVI file is made of one or more RIFF lists, the first with the headers and each with a list of frames
+        position = 0
+        while position + 12 <= file_size:
+            file.seek(position)
+            riff_id, riff_size, riff_type = struct.unpack('<4sI4s', file.read(12))
+
+            if riff_id != b'RIFF':
+                break
+
+            riff_end = min(position + 8 + riff_size, file_size)
+
+            for chunk_id, chunk_start, chunk_size in iterate_chunks(file, position + 12, riff_end):
+                if chunk_id == b'LIST':
+                    file.seek(chunk_start)
+                    list_type = file.read(4)
+
+                    if list_type == b'hdrl':
+                        # find the first video stream and its format
+                        n_streams = 0
+                        for header_id, header_start, header_size in iterate_chunks(file, chunk_start + 4, chunk_start + chunk_size):
+                            file.seek(header_start)
+                            if header_id == b'LIST' and file.read(4) == b'strl':
+                                stream_type = None
+                                for stream_chunk_id, stream_chunk_start, stream_chunk_size in iterate_chunks(file, header_start + 4, header_start + header_size):
+                                    file.seek(stream_chunk_start)
+                                    data = file.read(stream_chunk_size)
+
+                                    if stream_chunk_id == b'strh':
+                                        stream_type = data[:4]
+                                    elif stream_type == b'vids' and video_stream is None:
+                                        if stream_chunk_id == b'strf':
+                                            width, height, _, bit_count, fourcc = struct.unpack('<iiHH4s', data[4:20])
+                                        elif stream_chunk_id == b'indx':
+                                            super_index = data
+
+                                if stream_type == b'vids' and video_stream is None:
+                                    video_stream = n_streams
+                                n_streams += 1
+                    elif list_type == b'movi':
+                        movi_lists.append((chunk_start, chunk_start + chunk_size))
+                elif chunk_id == b'idx1' and idx1 is None:
+                    file.seek(chunk_start)
+                    idx1 = file.read(chunk_size)
+
+            position = riff_end + (riff_end & 1)
+
+        if video_stream is None:
+            return None
+
+        chunk_ids = ['{:02d}dc'.format(video_stream).encode('ascii'), '{:02d}db'.format(video_stream).encode('ascii')]
+
+        if super_index is not None:
+            # OpenDML (AVI 2.0) files point to a standard index for each RIFF list
+            _, _, _, n_entries = struct.unpack('<HBBI', super_index[:8])
+            entries = np.frombuffer(super_index[24:24 + 16*n_entries], dtype=[('offset', '<u8'), ('size', '<u4'), ('duration', '<u4')])
+
+            offsets, sizes = [], []
+            for entry in entries:
+                file.seek(int(entry['offset']) + 8)
+                data = file.read(int(entry['size']) - 8)
+
+                _, _, _, n_frames, _, base_offset = struct.unpack('<HBBI4sQ', data[:20])
+                frames = np.frombuffer(data[24:24 + 8*n_frames], dtype=[('offset', '<u4'), ('size', '<u4')])
+
+                offsets.append(base_offset + frames['offset'].astype(np.int64))
+                sizes.append(frames['size'])
+
+            offsets   = np.concatenate(offsets)
+            sizes     = np.concatenate(sizes)
+            keyframes = (sizes & 0x80000000) == 0
+            sizes     = sizes & 0x7fffffff
+        elif idx1 is not None and len(movi_lists) > 0:
+            entries = np.frombuffer(idx1[:len(idx1)//16*16], dtype=[('id', 'S4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4')])
+            entries = entries[np.isin(entries['id'], chunk_ids)]
+
+            if len(entries) == 0:
+                return None
+
+            # offsets are usually relative to the start of the list of frames, but some files use absolute positions
+            movi_start = movi_lists[0][0]
+            file.seek(movi_start + int(entries['offset'][0]))
+            if file.read(4) != entries['id'][0]:
+                movi_start = 0
+
+            offsets   = movi_start + entries['offset'].astype(np.int64) + 8
+            sizes     = entries['size']
+            keyframes = (entries['flags'] & AVIIF_KEYFRAME) != 0
+        elif len(movi_lists) > 0 and (fourcc in mjpeg_fourccs or fourcc in raw_fourccs):
+            # without an index, find the frames by walking through the lists of frames. this doesn't
+            # give keyframes, which isn't a problem when every frame is a keyframe
+            offsets, sizes = [], []
+            lists = list(movi_lists)
+            while len(lists) > 0:
+                start, end = lists.pop(0)
+                for chunk_id, chunk_start, chunk_size in iterate_chunks(file, start + 4, end):
+                    if chunk_id in chunk_ids:
+                        offsets.append(chunk_start)
+                        sizes.append(chunk_size)
+                    elif chunk_id == b'LIST':
+                        lists.append((chunk_start, chunk_start + chunk_size))
+
+            offsets   = np.array(offsets, dtype=np.int64)
+            sizes     = np.array(sizes, dtype=np.uint32)
+            keyframes = np.ones(len(offsets), dtype=bool)
+        else:
+            return None
+
+    # empty chunks mark dropped frames, which repeat the previous frame
+    kept_frames = np.maximum.accumulate(np.where(sizes > 0, np.arange(len(sizes)), 0))
+
+    return SeekIndex(offsets[kept_frames], sizes[kept_frames].astype(np.uint32), keyframes[kept_frames], fourcc, width, height, bit_count)
+
+def seek_index_path(video_path):
+    return os.path.splitext(video_path)[0] + "_seek_index.npz"
+
+def save_seek_index(video_path, seek_index):
+    stat = os.stat(video_path)
+
+    # write to a temporary file first, so that exiting while saving never leaves a truncated index
+    path      = seek_index_path(video_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        np.savez(file, offsets=seek_index.offsets, sizes=seek_index.sizes, keyframes=seek_index.keyframes,
+                 fourcc=np.frombuffer(seek_index.fourcc, dtype=np.uint8), format=np.array([seek_index.width, seek_index.height, seek_index.bit_count]),
+                 video_stat=np.array([stat.st_size, int(stat.st_mtime*1e6)]))
+    replace_file(temp_path, path)
+
+def load_seek_index(video_path):
+    # load the seek index of a video, as long as the video hasn't changed since it was built
+    try:
+        stat = os.stat(video_path)
+
+        with np.load(seek_index_path(video_path)) as data:
+            if list(data['video_stat']) != [stat.st_size, int(stat.st_mtime*1e6)]:
+                return None
+
+            width, height, bit_count = [ int(value) for value in data['format'] ]
+
+            return SeekIndex(data['offsets'], data['sizes'], data['keyframes'], data['fourcc'].tobytes(), width, height, bit_count)
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        # a damaged index is built again (BadZipfile is also named BadZipFile in Python 3)
+        return None
+
+def index_video(video_path):
+    # build and save the seek index of a video, returning how long it took
+    start_time = time.time()
+
+    try:
+        seek_index = build_seek_index(video_path)
+    except (IOError, OSError, struct.error, ValueError):
+        seek_index = None
+
+    if seek_index is None:
+        return video_path, None, "could not read the index of frames"
+
+    try:
+        save_seek_index(video_path, seek_index)
+    except (IOError, OSError) as error:
+        return video_path, None, str(error)
+
+    return video_path, time.time() - start_time, None
+
+def proxy_path(video_path):
+    return os.path.splitext(video_path)[0] + "_proxy.npy"
+
+def build_proxy(video_path, scale=0.25):
+    # transcode a video into a stack of downscaled frames, stored as a .npy file that can be memory-mapped.
+    # frames are BGR and transposed like the ones returned by VideoReader, so that the preview doesn't change
+    # when the full frame replaces the proxy frame
+    capture = cv2.VideoCapture(video_path)
+
+    seek_index = load_seek_index(video_path)
+    if seek_index is not None:
+        n_frames = len(seek_index)
+    else:
+        n_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    width  = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    proxy_width  = max(int(round(width*scale)), 1)
+    proxy_height = max(int(round(height*scale)), 1)
+
+    # write to a temporary file first so that an interrupted transcode never leaves a truncated proxy
+    temp_path = proxy_path(video_path) + ".tmp"
+    proxy     = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(n_frames, proxy_width, proxy_height, 3))
+
+    frame_num = 0
+    while frame_num < n_frames:
+        success, frame = capture.read()
+
+        if not success:
+            break
+
+        proxy[frame_num] = cv2.resize(frame, (proxy_width, proxy_height), interpolation=cv2.INTER_AREA).transpose((1, 0, 2))
+
+        frame_num += 1
+
+    capture.release()
+
+    # the frame count in the header of a video can be larger than the number of frames that can be read
+    if 0 < frame_num < n_frames:
+        proxy[frame_num:] = proxy[frame_num-1]
+
+    proxy.flush()
+    del proxy
+
+    replace_file(temp_path, proxy_path(video_path))
+
+def load_proxy(video_path):
+    # memory-map the proxy of a video, as long as it was made after the video was last changed. grayscale
+    # proxies made by earlier versions are ignored until they are made again
+    try:
+        if os.path.getmtime(proxy_path(video_path)) < os.path.getmtime(video_path):
+            return None
+
+        proxy = np.load(proxy_path(video_path), mmap_mode='r')
+
+        if proxy.ndim != 4:
+            return None
+
+        return proxy
+    except (IOError, OSError, ValueError):
+        return None
+
+def make_proxy(video_path):
+    # build the proxy of a video, returning how long it took
+    start_time = time.time()
+
+    try:
+        build_proxy(video_path)
+    except (IOError, OSError, ValueError, cv2.error) as error:
+        return video_path, None, str(error)
+
+    return video_path, time.time() - start_time, None
+
+class VideoReader(object):
+    # reads frames of a video, keeping a cache of decoded frames (up to cache_size MB). after every requested frame,
+    # a background thread decodes the frames around it, reading further ahead in the direction the requests are moving.
+    # frames can be read directly with get_frame, or requested with request_frame and picked up from the cache once
+    # the background thread has decoded them.
+    # the video is opened when a frame is first asked for, and can be released to free its file handle and decoder,
+    # in which case it is opened again, around the last requested frame, the next time a frame is asked for.
+    # if the video has a proxy, its downscaled frames are available without decoding through proxy_frame
+    def __init__(self, video_path, cache_size=500, read_ahead=100, read_behind=30, build_index=True):
+        self.video_path  = video_path
+        self.cache_size  = cache_size
+        self.read_ahead  = read_ahead
+        self.read_behind = read_behind
+        self.build_index = build_index
+
+        self.capture  = None
+        self.proxy    = None
+        self.n_frames = 0
+        self.width    = 0
+        self.height   = 0
+        self.position = 0 # frame number that the next read of the capture will return
+        self.is_open  = False
+
+        # frames are found using the seek index of the video once it is available
+        self.seek_index       = None
+        self.seek_index_found = False
+        self.video_file       = None
+
+        self.frames      = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.frame_bytes = None
+
+        self.target       = None
+        self.direction    = 1
+        self.stopped      = False
+        self.failed_frame = None # requested frame that couldn't be decoded
+
+        # the capture lock is held while decoding, the condition guards everything else
+        self.capture_lock = threading.Lock()
+        self.condition    = threading.Condition()
+
+    def open(self):
+        if self.is_open:
+            return
+
+        # the seek index is looked for the first time the video is opened
+        if not self.seek_index_found:
+            self.seek_index_found = True
+
+            seek_index = load_seek_index(self.video_path)
+            if seek_index is not None:
+                self.seek_index = seek_index
+            elif self.build_index:
+                self.index_thread = threading.Thread(target=self.build_seek_index)
+                self.index_thread.daemon = True
+                self.index_thread.start()
+
+        with self.capture_lock:
+            self.capture  = cv2.VideoCapture(self.video_path)
+            self.proxy    = load_proxy(self.video_path)
+            self.width    = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height   = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.position = 0
+            self.is_open  = True
+
+            if self.seek_index is None:
+                self.n_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            else:
+                self.n_frames = len(self.seek_index)
+
+                if self.seek_index.intra_only:
+                    self.video_file = open(self.video_path, 'rb')
+
+        # the background thread starts by decoding the frames around the last requested frame, if there was one
+        self.stopped = False
+        self.thread  = threading.Thread(target=self.prefetch_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def release(self):
+        if not self.is_open:
+            return
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.thread.join()
+
+        with self.capture_lock:
+            self.capture.release()
+            self.capture = None
+            self.proxy   = None
+            self.is_open = False
+
+            if self.video_file is not None:
+                self.video_file.close()
+                self.video_file = None
+
+        with self.condition:
+            self.frames.clear()
+            self.cache_bytes = 0
+
+    def build_seek_index(self):
+        try:
+            seek_index = build_seek_index(self.video_path)
+        except (IOError, OSError, struct.error, ValueError):
+            seek_index = None
+
+        if seek_index is None:
+            print("Could not build a seek index for '{}'.".format(self.video_path))
+        else:
+            try:
+                save_seek_index(self.video_path, seek_index)
+            except (IOError, OSError):
+                print("Could not save the seek index for '{}'.".format(self.video_path))
+
+            self.set_seek_index(seek_index)
+
+    def set_seek_index(self, seek_index):
+        with self.capture_lock:
+            self.seek_index = seek_index
+
+            if self.is_open:
+                self.n_frames = len(seek_index)
+
+                if seek_index.intra_only:
+                    self.video_file = open(self.video_path, 'rb')
+
+    def get_frame(self, frame_num):
+        self.open()
+
+        if frame_num < 0 or (self.n_frames > 0 and frame_num >= self.n_frames):
+            return None
+
+        frame = self.cached_frame(frame_num)
+
+        if frame is None:
+            with self.capture_lock:
+                # the frame may have been decoded by the background thread while we were waiting
+                frame = self.cached_frame(frame_num)
+
+                if frame is None:
+                    frame = self.read_frame(frame_num)
+
+        self.set_target(frame_num)
+
+        return frame
+
+    def request_frame(self, frame_num):
+        # have the background thread decode a frame without waiting for it. if several frames are requested
+        # before it gets to them, only the latest one is decoded
+        self.open()
+
+        if frame_num < 0 or (self.n_frames > 0 and frame_num >= self.n_frames):
+            return
+
+        self.set_target(frame_num)
+
+    def set_target(self, frame_num):
+        # let the background thread know which frames to decode next
+        with self.condition:
+            if self.target is not None and frame_num != self.target:
+                self.direction = 1 if frame_num > self.target else -1
+            if frame_num != self.target:
+                self.failed_frame = None
+            self.target = frame_num
+            self.condition.notify()
+
+    def frame_failed(self, frame_num):
+        # whether a requested frame will never be decoded, since it is beyond the end of the video or reading it failed
+        with self.condition:
+            return frame_num < 0 or (self.n_frames > 0 and frame_num >= self.n_frames) or frame_num == self.failed_frame
+
+    def proxy_frame(self, frame_num):
+        if self.proxy is None or not 0 <= frame_num < self.proxy.shape[0]:
+            return None
+
+        return self.proxy[frame_num]
+
+    def cached_frame(self, frame_num):
+        with self.condition:
+            frame = self.frames.pop(frame_num, None)
+
+            # move to the end of the queue
+            if frame is not None:
+                self.frames[frame_num] = frame
+
+            return frame
+
+    @profiled('video.read_frame')
+    def read_frame(self, frame_num):
+        # must be called while holding the capture lock
+        if self.video_file is not None:
+            # every frame can be decoded on its own, straight from the file
+            frame = self.seek_index.read_frame(self.video_file, frame_num)
+
+            if frame is None:
+                return None
+        else:
+            if self.seek_index is not None:
+                # decode forward from the closest keyframe, unless the capture is already between it and the frame
+                keyframe_num = self.seek_index.keyframe_before(frame_num)
+
+                if not keyframe_num <= self.position <= frame_num:
+                    with profiler.stage('video.seek'):
+                        self.capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe_num)
+                    self.position = keyframe_num
+
+                while self.position < frame_num:
+                    success, frame = self.capture.read()
+
+                    if not success:
+                        self.position = -1
+                        return None
+
+                    self.cache_frame(self.position, frame.transpose((1, 0, 2)))
+                    self.position += 1
+            elif frame_num != self.position:
+                with profiler.stage('video.seek'):
+                    self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+
+            success, frame = self.capture.read()
+
+            if not success:
+                self.position = -1
+                return None
+
+            self.position = frame_num + 1
+
+        frame = frame.transpose((1, 0, 2))
+
+        self.cache_frame(frame_num, frame)
+
+        return frame
+
+    def cache_frame(self, frame_num, frame):
+        with self.condition:
+            if frame_num not in self.frames:
+                self.frames[frame_num] = frame
+                self.cache_bytes      += frame.nbytes
+                self.frame_bytes       = frame.nbytes
+
+            # drop least recently used frames
+            while self.cache_bytes > self.cache_size*1e6 and len(self.frames) > 1:
+                _, old_frame = self.frames.popitem(last=False)
+                self.cache_bytes -= old_frame.nbytes
+
+    def frames_to_prefetch(self, target, direction):
+        # the requested frame itself comes first. the rest are generated once it has been read,
+        # so that the size of a frame is known
+        yield target
+
+        if self.frame_bytes is None:
+            return
+
+        # make sure the frames that are read ahead and behind fit in the cache
+        n_cached = int(0.8*self.cache_size*1e6/self.frame_bytes)
+        n_ahead  = min(self.read_ahead, 2*n_cached//3)
+        n_behind = min(self.read_behind, n_cached - n_ahead)
+
+        if direction == 1:
+            start, end = target - n_behind, target + n_ahead
+        else:
+            start, end = target - n_ahead, target + n_behind
+
+        start = max(start, 0)
+        if self.n_frames > 0:
+            end = min(end, self.n_frames - 1)
+
+        # frames are read in increasing order, since seeking backwards is much slower than reading the next frame.
+        # the frames in the direction of motion come first
+        if direction == 1:
+            frame_nums = list(range(target + 1, end + 1)) + list(range(start, target))
+        else:
+            frame_nums = list(range(start, target)) + list(range(target + 1, end + 1))
+
+        for frame_num in frame_nums:
+            yield frame_num
+
+    def prefetch_frames(self):
+        prefetched_target = None
+
+        while True:
+            with self.condition:
+                while not self.stopped and (self.target is None or self.target == prefetched_target):
+                    self.condition.wait()
+
+                if self.stopped:
+                    return
+
+                target    = self.target
+                direction = self.direction
+
+            for frame_num in self.frames_to_prefetch(target, direction):
+                with self.condition:
+                    # start over if a different frame was requested
+                    if self.stopped or self.target != target:
+                        break
+                    if frame_num in self.frames:
+                        continue
+
+                with self.capture_lock:
+                    frame = self.read_frame(frame_num)
+
+                if frame is None:
+                    if frame_num == target:
+                        with self.condition:
+                            self.failed_frame = target
+
+                    prefetched_target = target
+                    break
+            else:
+                prefetched_target = target
+
+class VideoPool(object):
+    # list-like container of video readers (or None for recordings without a video) that keeps at most max_open
+    # of them open at once, releasing the least recently used ones. readers are opened again when they are accessed
+    def __init__(self, max_open=16, cache_size=500):
+        self.max_open     = max_open
+        self.cache_size   = cache_size
+        self.readers      = []
+        self.open_readers = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.readers)
+
+    def __getitem__(self, index):
+        reader = self.readers[index]
+
+        if reader is not None:
+            # move to the end of the queue
+            self.open_readers.pop(reader, None)
+            self.open_readers[reader] = None
+
+            reader.open()
+
+            # release least recently used readers, always keeping the one being accessed
+            while len(self.open_readers) > self.max_open:
+                old_reader, _ = self.open_readers.popitem(last=False)
+                old_reader.release()
+
+        return reader
+
+    def __setitem__(self, index, video_path):
+        self.release(self.readers[index])
+
+        if video_path is None:
+            self.readers[index] = None
+        else:
+            self.readers[index] = VideoReader(video_path, cache_size=self.cache_size)
+
+    def __delitem__(self, index):
+        self.release(self.readers[index])
+
+        del self.readers[index]
+
+    def append(self, video_path=None):
+        self.readers.append(None)
+
+        self[len(self.readers)-1] = video_path
+
+    def release(self, reader):
+        if reader is not None:
+            self.open_readers.pop(reader, None)
+            reader.release()
+
+    def release_all(self):
+        # close every video, eg. before quitting. videos are opened again when they are next needed
+        for reader in self.readers:
+            self.release(reader)
+
+class Playback(object):
+    # plays a video from a frame at a speed. frames are shown at fixed ticks of the clock, at most display_rate
+    # times per second, and a worker thread decodes the frames of upcoming ticks into a fixed number of
+    # preallocated slots. frames that aren't decoded by their tick are dropped, so playback never falls behind
+    def __init__(self, video_path, start_frame, n_frames, speed, framerate, display_rate, seek_index=None, buffer_size=32):
+        self.video_path  = video_path
+        self.start_frame = start_frame
+        self.n_frames    = n_frames
+        self.seek_index  = seek_index
+        self.buffer_size = buffer_size
+
+        self.step     = max(1.0, speed*framerate/float(display_rate)) # video frames per tick
+        self.interval = self.step/(speed*framerate)                   # s per tick
+
+        self.buffer     = None # array of shape (slots, height, width, 3), created once the frame size is known
+        self.slot_ticks = [-1]*buffer_size
+
+        self.next_tick  = 0  # next tick to decode
+        self.shown_tick = -1 # last tick taken for showing
+        self.n_shown    = 0
+        self.n_dropped  = 0
+        self.finished   = False
+        self.stopped    = False
+
+        self.condition = threading.Condition()
+        self.thread    = None
+
+    def frame_num(self, tick):
+        return self.start_frame + int(round(tick*self.step))
+
+    def current_tick(self):
+        return int((time.time() - self.start_time)/self.interval)
+
+    def start(self, start_time=None):
+        # playbacks given the same start time show the same frames at the same time
+        self.start_time = time.time() if start_time is None else start_time
+
+        self.thread = threading.Thread(target=self.decode_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        if self.thread is not None:
+            self.thread.join()
+
+    def take_frame(self):
+        # return the frame number and frame of the current tick, or None if it isn't due or wasn't decoded in time
+        tick = self.current_tick()
+
+        if tick <= self.shown_tick:
+            return None
+
+        with self.condition:
+            slot = tick % self.buffer_size
+
+            # the frame is copied out of its slot, which the worker thread reuses once the tick has passed
+            if self.slot_ticks[slot] == tick:
+                frame = self.buffer[slot].transpose((1, 0, 2)).copy()
+            else:
+                frame = None
+
+            # ticks that passed since the last one are dropped
+            self.n_dropped += tick - self.shown_tick - 1 + (frame is None)
+            self.n_shown   += frame is not None
+
+            self.shown_tick = tick
+            self.condition.notify()
+
+        if frame is None:
+            return None
+
+        return self.frame_num(tick), frame
+
+    def done(self):
+        # whether the end of the video was reached
+        return self.frame_num(self.current_tick()) >= self.n_frames or (self.finished and self.next_tick <= self.shown_tick)
+
+    def decode_frames(self):
+        capture    = None
+        video_file = None
+
+        # intra-only videos are decoded straight from the file, frame by frame. other videos are read in order,
+        # skipping frames that aren't shown without decoding them
+        if self.seek_index is not None and self.seek_index.intra_only:
+            video_file = open(self.video_path, 'rb')
+        else:
+            capture = cv2.VideoCapture(self.video_path)
+            capture.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            position = self.start_frame
+
+        try:
+            while True:
+                with self.condition:
+                    # wait for a free slot
+                    while not self.stopped and self.next_tick - self.shown_tick >= self.buffer_size:
+                        self.condition.wait()
+
+                    if self.stopped:
+                        break
+
+                    # skip ticks that are already due
+                    tick = max(self.next_tick, self.current_tick() + 1)
+
+                frame_num = self.frame_num(tick)
+
+                if frame_num >= self.n_frames:
+                    break
+
+                with profiler.stage('playback.decode'):
+                    if video_file is not None:
+                        frame = self.seek_index.read_frame(video_file, frame_num)
+                    else:
+                        if frame_num - position >= max_grab_frames:
+                            with profiler.stage('video.seek'):
+                                capture.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+                            position = frame_num
+
+                        while position < frame_num:
+                            capture.grab()
+                            position += 1
+
+                        success, frame = capture.read()
+                        position += 1
+
+                        if not success:
+                            frame = None
+
+                if frame is None:
+                    break
+
+                with self.condition:
+                    if self.buffer is None:
+                        self.buffer = np.zeros((self.buffer_size,) + frame.shape, dtype=np.uint8)
+
+                    slot = tick % self.buffer_size
+                    self.buffer[slot]     = frame
+                    self.slot_ticks[slot] = tick
+                    self.next_tick        = tick + 1
+        finally:
+            self.finished = True
+
+            if capture is not None:
+                capture.release()
+            if video_file is not None:
+                video_file.close()
+
+if __name__ == "__main__":
+    # build seek indices or proxies ahead of time for every video in a folder,
+    # eg. "python video.py index /path/to/videos" or "python video.py proxy /path/to/videos"
+    command   = sys.argv[1]
+    directory = sys.argv[2]
+
+    video_paths = sorted(glob.glob(os.path.join(directory, '*.avi')))
+
+    if command == "index":
+        function, verb = index_video, "Indexed"
+    elif command == "proxy":
+        function, verb = make_proxy, "Made proxy of"
+    else:
+        sys.exit("Unknown command '{}'.".format(command))
+
+    start_time = time.time()
+
+    pool = multiprocessing.Pool()
+    for video_path, video_time, error in pool.imap_unordered(function, video_paths):
+        if error is None:
+            print("{} '{}' in {:.2f} s.".format(verb, video_path, video_time))
+        else:
+            print("Error processing '{}': {}".format(video_path, error))
+    pool.close()
+    pool.join()
+
+    print("Processed {} videos in {:.2f} s.".format(len(video_paths), time.time() - start_time))